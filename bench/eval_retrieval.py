@@ -0,0 +1,170 @@
+"""
+Offline retrieval evaluation against knowledge_base.yaml
+Indexes the YAML pages with sync_notion.py's pipeline into temporary stores, asks
+questions whose answer page is known, and reports recall@k, MRR and p50/p99 latency
+for each retriever configuration. Uses a local hash embedding unless --embedding is given;
+real embeddings are read from and added to the shared embedding store (EMBEDDING_STORE_PATH).
+
+    python bench/eval_retrieval.py
+    python bench/eval_retrieval.py --questions my_questions.jsonl --embedding openai --json report.json
+
+A questions file has one {"question": ..., "page": <page title>} object per line;
+without one, questions are generated from the page content (section headings and lines
+found on only one page) with the page title's words taken out.
+"""
+
+import argparse
+import contextlib
+import json
+import re
+import tempfile
+import time
+from collections import Counter
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# Everything the pipeline writes goes to a temporary directory (settings are read at import time)
+WORKDIR = tempfile.mkdtemp(prefix="eval-retrieval-")
+os.environ["CHROMA_DB_PATH"] = WORKDIR
+os.environ["NUMPY_STORE_PATH"] = os.path.join(WORKDIR, "numpy_store")
+os.environ["BM25_INDEX_PATH"] = os.path.join(WORKDIR, "bm25_index.json")
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false") # Every configuration pays for its query embeddings
+os.environ.setdefault("OPENAI_API_KEY", "eval")
+if not os.path.exists(os.environ.get("PERSONAS_FILE", "personas.json")):
+    os.environ["PERSONAS_FILE"] = os.path.join(ROOT, "personas.example.json")
+os.environ["EMBEDDING_PROVIDER"] = sys.argv[sys.argv.index("--embedding") + 1] if "--embedding" in sys.argv else "stub"
+if os.environ["EMBEDDING_PROVIDER"] == "stub":
+    os.environ["EMBEDDING_STORE_PATH"] = os.path.join(WORKDIR, "embedding_store.sqlite3") # Hash vectors are free; keep them out of the shared store
+
+from settings import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from bench.fakes import HashEmbeddingProvider, index_knowledge_base, load_knowledge_base_pages
+from lib import embeddings, notion_rag
+from lib.sync_notion import build_bm25_index, chunk_token_budget
+from lib.vector_store import open_vector_store
+
+embeddings.PROVIDERS["stub"] = HashEmbeddingProvider
+
+# notion_rag settings for each retriever configuration
+CONFIGS = {
+    "vector": {"HYBRID_RETRIEVAL_ENABLED": False, "MMR_ENABLED": False},
+    "hybrid": {"HYBRID_RETRIEVAL_ENABLED": True, "MMR_ENABLED": False},
+    "hybrid+mmr": {"HYBRID_RETRIEVAL_ENABLED": True, "MMR_ENABLED": True},
+}
+
+
+def _question_lines(content):
+    """Section headings, list items and paragraph lines of a page, without their markdown or code blocks."""
+    lines, in_code = [], False
+    for line in content.splitlines():
+        if line.strip().startswith("```"):
+            in_code = not in_code
+            continue
+        if in_code or re.match(r"^\s*# ", line): # The page heading repeats the title
+            continue
+        line = re.sub(r"^\s*(?:#{2,6}|[-*]|\d+\.)\s+", "", line).replace("**", "").strip()
+        if line:
+            lines.append(line)
+    return lines
+
+def _without_title(line, title):
+    """The line with every word of the page title removed, so the question can't match on the title."""
+    title_words = {word.lower() for word in re.findall(r"\w+", title)}
+    return " ".join(word for word in line.split() if re.sub(r"\W", "", word).lower() not in title_words)
+
+def generate_questions(pages):
+    """(question, page title) pairs built from lines of content that occur on only one page."""
+    candidates = {title: [_without_title(line, title) for line in _question_lines(content)] for title, content, _ in pages}
+    pages_per_line = Counter(line.lower() for found in candidates.values() for line in set(found))
+    questions = []
+    for title, _, _ in pages:
+        questions.extend(
+            (line, title) for line in dict.fromkeys(candidates[title])
+            if len(line.split()) >= 3 and pages_per_line[line.lower()] == 1
+        )
+    return questions
+
+def load_questions(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return [(item["question"], item["page"]) for item in map(json.loads, file) if item]
+
+def build_stores(pages, backends, chunk_tokens, overlap_tokens):
+    """Indexes every page into each backend's store and builds the BM25 index once."""
+    stores = {}
+    for backend in backends:
+        stores[backend] = open_vector_store(backend, create=True)
+        index_knowledge_base(stores[backend], pages, max_tokens=chunk_tokens, overlap_tokens=overlap_tokens)
+    build_bm25_index(stores[backends[0]])
+    return stores
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+@contextlib.contextmanager
+def configured(collection, settings):
+    """Points notion_rag at `collection` with `settings` applied, restoring its globals afterwards."""
+    names = ["_collection", *settings]
+    saved = {name: getattr(notion_rag, name) for name in names}
+    try:
+        notion_rag._collection = collection
+        for name, value in settings.items():
+            setattr(notion_rag, name, value)
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(notion_rag, name, value)
+
+def evaluate(questions, k):
+    """Runs every question through notion_rag.search as currently configured."""
+    notion_rag.search("warm up", n_results=k)
+    latencies, reciprocal_ranks = [], []
+    for question, page in questions:
+        began = time.perf_counter()
+        chunks = notion_rag.search(question, n_results=k)
+        latencies.append((time.perf_counter() - began) * 1000)
+        titles = [chunk["metadata"]["title"] for chunk in chunks]
+        reciprocal_ranks.append(1.0 / (titles.index(page) + 1) if page in titles else 0.0)
+    return {
+        f"recall@{k}": sum(1 for rank in reciprocal_ranks if rank) / len(questions),
+        "mrr": sum(reciprocal_ranks) / len(questions),
+        "p50_ms": percentile(latencies, 0.5),
+        "p99_ms": percentile(latencies, 0.99),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", help="JSONL file of {question, page} pairs (default: generated from the YAML)")
+    parser.add_argument("--k", type=int, default=3, help="Chunks retrieved per question")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_MAX_TOKENS, help="Tokens of page text per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP_TOKENS, help="Tokens repeated when a section is split")
+    parser.add_argument("--embedding", help="EMBEDDING_PROVIDER to evaluate (default: a local hash embedding stub)")
+    parser.add_argument("--backends", default="chroma,numpy", help="Comma-separated VECTOR_STORE_BACKEND values")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help=f"Comma-separated configurations from: {', '.join(CONFIGS)}")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+    args.chunk_tokens = chunk_token_budget(max_tokens=args.chunk_tokens)
+
+    pages = load_knowledge_base_pages()
+    questions = load_questions(args.questions) if args.questions else generate_questions(pages)
+    backends = args.backends.split(",")
+    began = time.perf_counter()
+    stores = build_stores(pages, backends, args.chunk_tokens, args.chunk_overlap)
+    print(f"📊 Retrieval eval: {len(questions)} questions over {len(pages)} pages ({stores[backends[0]].count()} chunks, "
+          f"indexed in {time.perf_counter() - began:.1f}s, data in {WORKDIR})")
+
+    report = {"questions": len(questions), "k": args.k, "chunk_tokens": args.chunk_tokens, "chunk_overlap": args.chunk_overlap, "results": {}}
+    print(f"\n  {'backend':<9}{'config':<13}{f'recall@{args.k}':>10}{'MRR':>8}{'p50 ms':>9}{'p99 ms':>9}")
+    for backend in backends:
+        for config in args.configs.split(","):
+            with configured(stores[backend], CONFIGS[config]):
+                result = evaluate(questions, args.k)
+            report["results"][f"{backend}/{config}"] = result
+            print(f"  {backend:<9}{config:<13}{result[f'recall@{args.k}']:>10.3f}{result['mrr']:>8.3f}{result['p50_ms']:>9.2f}{result['p99_ms']:>9.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nReport written to {args.json}")
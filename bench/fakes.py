@@ -0,0 +1,271 @@
+"""
+In-process stand-ins for Slack, OpenAI, the embedding provider and the Notion knowledge base
+Used by the benchmarks so the bot's real handler code runs without network calls
+"""
+
+import asyncio
+import hashlib
+import itertools
+import re
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+import numpy as np
+import yaml
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.metadata_filters import PAGE_PROPERTIES, page_metadata
+
+KNOWLEDGE_BASE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge_base.yaml")
+
+
+# --- Embeddings ---
+def hash_embedding(text, dim=256):
+    """Deterministic bag-of-words embedding (hashed word counts, L2-normalised)."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in re.findall(r"\w+", text.lower()):
+        vector[int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:4], "little") % dim] += 1.0
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class HashEmbeddingProvider:
+    """An embedding provider (see lib/embeddings.py) built on hash_embedding, for offline runs."""
+
+    def __init__(self, dim=256):
+        self.name = f"stub:hash-{dim}"
+        self.dimension = dim
+
+    def embed(self, texts):
+        return [hash_embedding(text, self.dimension) for text in texts]
+
+
+# --- OpenAI ---
+class _Counters:
+    def __init__(self):
+        self.calls = Counter()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def count(self, kind, prompt_tokens=0, completion_tokens=0):
+        with self._lock:
+            self.calls[kind] += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+            }
+
+
+def _prompt_tokens(messages):
+    # Roughly 4 characters per token, enough for a load model
+    return sum(len(message["content"]) for message in messages) // 4
+
+def _answer_tokens(messages, completion_tokens):
+    persona = messages[0]["content"].split(".")[0]
+    return [f"{persona} " if i == 0 else f"tok{i} " for i in range(completion_tokens)]
+
+def _completion(content, prompt_tokens, completion_tokens):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    )
+
+def _chunk(content=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if content is not None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class FakeOpenAI:
+    """
+    Stands in for the `openai` module: chat completions wait `latency` seconds for the
+    first token, then produce `completion_tokens` tokens at `tokens_per_second`.
+    """
+
+    def __init__(self, latency=0.5, tokens_per_second=50.0, completion_tokens=60, embedding_latency=0.05):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.embedding_latency = embedding_latency
+        self.counters = _Counters()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    def _create_completion(self, model, messages, stream=False, stream_options=None, **kwargs):
+        tokens = _answer_tokens(messages, self.completion_tokens)
+        prompt_tokens = _prompt_tokens(messages)
+        self.counters.count("chat.completions", prompt_tokens, len(tokens))
+        if stream:
+            return self._stream(tokens, prompt_tokens, (stream_options or {}).get("include_usage"))
+        time.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return _completion("".join(tokens), prompt_tokens, len(tokens))
+
+    def _stream(self, tokens, prompt_tokens, include_usage):
+        time.sleep(self.latency)
+        for token in tokens:
+            time.sleep(1 / self.tokens_per_second)
+            yield _chunk(token)
+        if include_usage:
+            yield _chunk(usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(tokens)))
+
+    def _create_embedding(self, input, model=None, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        self.counters.count("embeddings")
+        time.sleep(self.embedding_latency)
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=hash_embedding(text)) for i, text in enumerate(texts)])
+
+
+class FakeAsyncOpenAI(FakeOpenAI):
+    """Stands in for `openai.AsyncOpenAI()`."""
+
+    async def _create_completion(self, model, messages, stream=False, stream_options=None, **kwargs):
+        tokens = _answer_tokens(messages, self.completion_tokens)
+        prompt_tokens = _prompt_tokens(messages)
+        self.counters.count("chat.completions", prompt_tokens, len(tokens))
+        if stream:
+            return self._stream(tokens, prompt_tokens, (stream_options or {}).get("include_usage"))
+        await asyncio.sleep(self.latency + len(tokens) / self.tokens_per_second)
+        return _completion("".join(tokens), prompt_tokens, len(tokens))
+
+    async def _stream(self, tokens, prompt_tokens, include_usage):
+        await asyncio.sleep(self.latency)
+        for token in tokens:
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield _chunk(token)
+        if include_usage:
+            yield _chunk(usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(tokens)))
+
+    async def _create_embedding(self, input, model=None, **kwargs):
+        texts = [input] if isinstance(input, str) else list(input)
+        self.counters.count("embeddings")
+        await asyncio.sleep(self.embedding_latency)
+        return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=hash_embedding(text)) for i, text in enumerate(texts)])
+
+
+# --- Slack ---
+class FakeSlackClient:
+    """Records the Web API calls the bot makes; each call takes `latency` seconds."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.counters = _Counters()
+        self.posted = [] # (channel, thread_ts, ts, text)
+        self.updates = [] # (channel, ts, text)
+        self._ts = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _next_ts(self):
+        with self._lock:
+            return f"{time.time():.0f}.{next(self._ts):06d}"
+
+    def _post(self, channel, text, thread_ts=None, **kwargs):
+        self.counters.count("chat_postMessage")
+        ts = self._next_ts()
+        self.posted.append((channel, thread_ts, ts, text))
+        return {"ok": True, "channel": channel, "ts": ts}
+
+    def _update(self, channel, ts, text, **kwargs):
+        self.counters.count("chat_update")
+        self.updates.append((channel, ts, text))
+        return {"ok": True, "channel": channel, "ts": ts}
+
+    def _history(self, kind):
+        self.counters.count(kind)
+        return {"ok": True, "messages": [], "response_metadata": {"next_cursor": ""}}
+
+    def chat_postMessage(self, channel, text, thread_ts=None, **kwargs):
+        time.sleep(self.latency)
+        return self._post(channel, text, thread_ts)
+
+    def chat_update(self, channel, ts, text, **kwargs):
+        time.sleep(self.latency)
+        return self._update(channel, ts, text)
+
+    def conversations_history(self, channel, **kwargs):
+        time.sleep(self.latency)
+        return self._history("conversations_history")
+
+    def conversations_replies(self, channel, ts, **kwargs):
+        time.sleep(self.latency)
+        return self._history("conversations_replies")
+
+    def say_for(self, channel):
+        """Returns a Bolt-style `say` bound to the channel."""
+        def say(text, thread_ts=None, **kwargs):
+            return self.chat_postMessage(channel=channel, text=text, thread_ts=thread_ts)
+        return say
+
+
+class FakeAsyncSlackClient(FakeSlackClient):
+    """Async variant of FakeSlackClient, for the AsyncApp code path."""
+
+    async def chat_postMessage(self, channel, text, thread_ts=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._post(channel, text, thread_ts)
+
+    async def chat_update(self, channel, ts, text, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._update(channel, ts, text)
+
+    async def conversations_history(self, channel, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._history("conversations_history")
+
+    async def conversations_replies(self, channel, ts, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._history("conversations_replies")
+
+    def say_for(self, channel):
+        async def say(text, thread_ts=None, **kwargs):
+            return await self.chat_postMessage(channel=channel, text=text, thread_ts=thread_ts)
+        return say
+
+
+# --- Knowledge base ---
+def load_knowledge_base_pages(path=KNOWLEDGE_BASE_PATH):
+    """Returns [(title, content, metadata)] for every page in knowledge_base.yaml, with the metadata sync_notion.py stores."""
+    with open(path, "r", encoding="utf-8") as file:
+        schema = yaml.safe_load(file)
+    pages = []
+    for category in schema["content"].values():
+        for documents in category.values():
+            for document in documents:
+                # The page properties create_knowledge_base.py sets (the YAML keys match the metadata keys)
+                properties = {
+                    name: {"multi_select": [{"name": value} for value in document[key]]} if property_type == "multi_select"
+                    else {"select": {"name": document[key]}}
+                    for name, (key, property_type) in PAGE_PROPERTIES.items() if document.get(key)
+                }
+                pages.append((document["title"], document["content"], page_metadata({"properties": properties})))
+    return pages
+
+def index_knowledge_base(store, pages=None, copies=1, max_tokens=None, overlap_tokens=None):
+    """
+    Indexes knowledge_base.yaml (or `pages` from load_knowledge_base_pages) into a vector store
+    with sync_notion.py's chunking and embedding, as pages page-0, page-1, ... `copies` repeats
+    the corpus to grow the store. Returns the number of chunks written.
+    """
+    # Imported here: settings are read at import time, after the caller has pointed them at its own directory
+    from settings import CHUNK_OVERLAP_TOKENS
+    from lib.sync_notion import ChunkIndexer, chunk_token_budget, index_page
+    pages = pages if pages is not None else load_knowledge_base_pages()
+    max_tokens = max_tokens or chunk_token_budget()
+    overlap_tokens = CHUNK_OVERLAP_TOKENS if overlap_tokens is None else overlap_tokens
+    indexer = ChunkIndexer(store)
+    for copy in range(copies):
+        for number, (title, content, page_properties) in enumerate(pages):
+            page_id = f"page-{copy * len(pages) + number}"
+            metadata = {"title": title, "source_url": f"https://www.notion.so/{page_id}", **page_properties}
+            index_page(indexer, page_id, content, metadata, max_tokens, overlap_tokens)
+    indexer.flush()
+    store.flush()
+    return indexer.batcher.chunks
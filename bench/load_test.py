@@ -0,0 +1,271 @@
+"""
+Offline load test for the Slack bot
+Replays a JSONL trace of mentions through main.py's real app_mention handler against
+in-process Slack/OpenAI fakes and reports throughput, end-to-end latency and per-stage
+latency. Retrieval is the real one (get_retriever() and lib/notion_rag.py) over
+knowledge_base.yaml, indexed into a temporary store with a local hash embedding.
+Bot features are configured from the environment as usual.
+
+    python bench/load_test.py bench/sample_trace.jsonl --rate 10 --count 200
+    ASYNC_MODE=true SCHEDULER_ENABLED=true python bench/load_test.py bench/sample_trace.jsonl --json after.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# The bot reads its configuration at import time; everything retrieval writes goes to a temporary directory
+WORKDIR = tempfile.mkdtemp(prefix="bench-load-")
+os.environ["CHROMA_DB_PATH"] = WORKDIR
+os.environ["NUMPY_STORE_PATH"] = os.path.join(WORKDIR, "numpy_store")
+os.environ["BM25_INDEX_PATH"] = os.path.join(WORKDIR, "bm25_index.json")
+os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(WORKDIR, "query_embeddings.sqlite3")
+os.environ["EMBEDDING_STORE_PATH"] = os.path.join(WORKDIR, "embedding_store.sqlite3") # Keep hash vectors out of the shared store
+os.environ["EMBEDDING_PROVIDER"] = "stub"
+os.environ["RETRIEVER_BACKEND"] = "chroma" # In-process notion_rag, whichever VECTOR_STORE_BACKEND is set
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("SLACK_BOT_TOKEN", "xoxb-bench")
+if not os.path.exists(os.environ.get("PERSONAS_FILE", "personas.json")):
+    os.environ["PERSONAS_FILE"] = os.path.join(ROOT, "personas.example.json")
+
+import main
+from bench.fakes import FakeAsyncOpenAI, FakeAsyncSlackClient, FakeOpenAI, FakeSlackClient, HashEmbeddingProvider, index_knowledge_base
+from lib import embeddings
+from lib.prompt_builder import get_tokenizer
+from lib.sync_notion import build_bm25_index
+from lib.telemetry import stage_stats
+from lib.vector_store import open_vector_store
+
+embeddings.PROVIDERS["stub"] = HashEmbeddingProvider
+
+
+def load_trace(path, channels):
+    """
+    Reads mentions from a JSONL file. Each line may give "text", "channel" and "thread_ts";
+    lines without "text" (e.g. requests.jsonl) use their title and body. Mentions with no
+    persona @mention are addressed to the personas in turn.
+    """
+    personas = itertools.cycle(main.PERSONAS)
+    mentions = []
+    with open(path, "r", encoding="utf-8") as file:
+        for i, line in enumerate(line for line in file if line.strip()):
+            entry = json.loads(line)
+            text = entry.get("text") or " ".join(filter(None, [entry.get("title"), entry.get("body")]))
+            if "<@" not in text:
+                text = f"<@{next(personas)}> {text}"
+            mentions.append({
+                "text": text,
+                "channel": entry.get("channel", f"CBENCH{i % channels}"),
+                "thread_ts": entry.get("thread_ts"),
+            })
+    return mentions
+
+def percentile(values, q):
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+class Recorder:
+    """Tracks when each mention was dispatched and when the bot finished with it."""
+
+    def __init__(self):
+        self.started = {}
+        self.finished = {}
+        self.rejected = set()
+        self._lock = threading.Lock()
+
+    def start(self, event_id):
+        with self._lock:
+            self.started[event_id] = time.perf_counter()
+
+    def finish(self, event_id):
+        with self._lock:
+            self.finished[event_id] = time.perf_counter()
+
+    def reject(self, event_id):
+        with self._lock:
+            self.rejected.add(event_id)
+
+    def outstanding(self):
+        with self._lock:
+            return len(self.started) - len(self.finished) - len(self.rejected)
+
+    def latencies(self):
+        with self._lock:
+            return sorted(self.finished[event_id] - self.started[event_id] for event_id in self.finished)
+
+
+def make_body(mention, n):
+    ts = f"{1700000000 + n}.000100"
+    event = {
+        "type": "app_mention",
+        "user": "UBENCHUSER",
+        "text": mention["text"],
+        "channel": mention["channel"],
+        "ts": ts,
+        "client_msg_id": str(uuid.uuid4()),
+    }
+    if mention["thread_ts"]:
+        event["thread_ts"] = mention["thread_ts"]
+    return {"event_id": f"EvBENCH{n}", "event": event}
+
+def instrument(recorder):
+    """Times every mention through main.py's handlers without changing what they do."""
+    answer_mention, async_answer_mention = main.answer_mention, main.async_answer_mention
+
+    def timed_answer_mention(body, *args):
+        try:
+            return answer_mention(body, *args)
+        finally:
+            recorder.finish(body["event_id"])
+
+    async def async_timed_answer_mention(body, *args):
+        try:
+            return await async_answer_mention(body, *args)
+        finally:
+            recorder.finish(body["event_id"])
+
+    main.answer_mention = timed_answer_mention
+    main.async_answer_mention = async_timed_answer_mention
+
+def make_say(slack, recorder, body):
+    """`say` for one event; the queue-full reply marks the mention as rejected."""
+    say = slack.say_for(body["event"]["channel"])
+    if main.ASYNC_MODE:
+        async def async_say(text, **kwargs):
+            if text == main.QUEUE_FULL_MESSAGE:
+                recorder.reject(body["event_id"])
+            return await say(text, **kwargs)
+        return async_say
+
+    def sync_say(text, **kwargs):
+        if text == main.QUEUE_FULL_MESSAGE:
+            recorder.reject(body["event_id"])
+        return say(text, **kwargs)
+    return sync_say
+
+def run_sync(bodies, rate, slack, recorder, listener_threads, timeout):
+    logger = logging.getLogger("bench")
+    # Bolt's socket mode adapter runs listeners on a thread pool of this size
+    with ThreadPoolExecutor(max_workers=listener_threads) as listeners:
+        started = time.perf_counter()
+        for n, body in enumerate(bodies):
+            time.sleep(max(0.0, started + n / rate - time.perf_counter()))
+            recorder.start(body["event_id"])
+            listeners.submit(main.handle_app_mention_events, body, slack, make_say(slack, recorder, body), logger)
+        deadline = time.perf_counter() + timeout
+        while recorder.outstanding() and time.perf_counter() < deadline:
+            time.sleep(0.01)
+    return time.perf_counter() - started
+
+async def run_async(bodies, rate, slack, recorder, timeout):
+    logger = logging.getLogger("bench")
+    tasks = []
+    started = time.perf_counter()
+    for n, body in enumerate(bodies):
+        await asyncio.sleep(max(0.0, started + n / rate - time.perf_counter()))
+        recorder.start(body["event_id"])
+        tasks.append(asyncio.create_task(main.async_handle_app_mention_events(body, slack, make_say(slack, recorder, body), logger)))
+    deadline = time.perf_counter() + timeout
+    while recorder.outstanding() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.01)
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return time.perf_counter() - started
+
+def print_report(report):
+    print(f"\n📊 Load test: {report['mentions']} mentions at {report['rate']}/s ({'async' if report['config']['ASYNC_MODE'] else 'sync'})")
+    print(f"  Completed: {report['completed']}  Rejected: {report['rejected']}  Unfinished: {report['unfinished']}")
+    print(f"  Wall time: {report['wall_seconds']:.2f}s  Throughput: {report['throughput']:.2f} mentions/s")
+    latency = report["latency_ms"]
+    print(f"  End-to-end latency: p50 {latency['p50']:.0f}ms  p95 {latency['p95']:.0f}ms  p99 {latency['p99']:.0f}ms  max {latency['max']:.0f}ms")
+    print(f"  OpenAI: {report['openai']}")
+    print(f"  Slack: {report['slack']['calls']}")
+    print("\n  Stage                     count     p50ms     p95ms     p99ms     maxms")
+    for name, stats in report["stages"].items():
+        print(f"  {name:<24}{stats['count']:>6}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['max_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="JSONL file of mentions to replay")
+    parser.add_argument("--rate", type=float, default=5.0, help="Mentions dispatched per second")
+    parser.add_argument("--count", type=int, help="Mentions to send, cycling through the trace (default: one pass)")
+    parser.add_argument("--channels", type=int, default=4, help="Channels to spread mentions over when the trace gives none")
+    parser.add_argument("--openai-latency", type=float, default=0.5, help="Seconds to the first completion token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--completion-tokens", type=int, default=60)
+    parser.add_argument("--slack-latency", type=float, default=0.05, help="Seconds per Slack Web API call")
+    parser.add_argument("--corpus-copies", type=int, default=1, help="Repeat knowledge_base.yaml to grow the vector store")
+    parser.add_argument("--listener-threads", type=int, default=10, help="Bolt listener threads (sync mode)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds to wait for outstanding mentions")
+    parser.add_argument("--json", help="Also write the report to this file, to compare runs")
+    args = parser.parse_args()
+
+    # Swap the network clients for the fakes
+    fake_openai = (FakeAsyncOpenAI if main.ASYNC_MODE else FakeOpenAI)(args.openai_latency, args.tokens_per_second, args.completion_tokens)
+    slack = (FakeAsyncSlackClient if main.ASYNC_MODE else FakeSlackClient)(args.slack_latency)
+    if main.ASYNC_MODE:
+        main.async_openai = fake_openai
+    else:
+        main.openai = fake_openai
+    get_tokenizer() # Load it now rather than inside the first timed mention
+    print(f"Indexing knowledge_base.yaml into {WORKDIR}...")
+    store = open_vector_store(create=True)
+    index_knowledge_base(store, copies=args.corpus_copies)
+    build_bm25_index(store)
+    print(f"Vector store has {store.count()} chunks")
+    main.retriever.warm_up() # The bot opens its own store and BM25 index through notion_rag
+
+    mentions = load_trace(args.trace, args.channels)
+    bodies = [make_body(mentions[n % len(mentions)], n) for n in range(args.count or len(mentions))]
+    recorder = Recorder()
+    instrument(recorder)
+    stage_stats.reset()
+
+    if main.ASYNC_MODE:
+        wall_seconds = asyncio.run(run_async(bodies, args.rate, slack, recorder, args.timeout))
+    else:
+        wall_seconds = run_sync(bodies, args.rate, slack, recorder, args.listener_threads, args.timeout)
+
+    latencies = recorder.latencies()
+    report = {
+        "mentions": len(bodies),
+        "rate": args.rate,
+        "completed": len(latencies),
+        "rejected": len(recorder.rejected),
+        "unfinished": recorder.outstanding(),
+        "wall_seconds": wall_seconds,
+        "throughput": len(latencies) / wall_seconds if wall_seconds else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.50) * 1000,
+            "p95": percentile(latencies, 0.95) * 1000,
+            "p99": percentile(latencies, 0.99) * 1000,
+            "max": latencies[-1] * 1000 if latencies else 0.0,
+        },
+        "stages": stage_stats.summary(),
+        "openai": fake_openai.counters.stats(),
+        "slack": slack.counters.stats(),
+        "config": {
+            name: getattr(main, name) for name in (
+                "ASYNC_MODE", "STREAM_RESPONSES", "ANSWER_CACHE_ENABLED", "THREAD_HISTORY_ENABLED",
+                "SCHEDULER_ENABLED", "SCHEDULER_WORKERS", "MAX_CONCURRENT_COMPLETIONS",
+                "COALESCE_COMPLETIONS", "MULTI_PERSONA_FANOUT"
+            )
+        },
+        "args": vars(args),
+    }
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nReport written to {args.json}")
@@ -0,0 +1,104 @@
+"""
+Benchmark of the NumPy vector store against ChromaDB on the same data
+Loads random unit vectors into both stores (in temporary directories) and reports
+build time, single-query and batched-query latency, and the recall of Chroma's
+approximate index against the NumPy store's exact top-k.
+
+    python bench/vector_store_bench.py --chunks 5000 --dim 1536
+"""
+
+import argparse
+import tempfile
+import time
+import sys
+import os
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+# settings.py needs these at import time
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+if not os.path.exists(os.environ.get("PERSONAS_FILE", "personas.json")):
+    os.environ["PERSONAS_FILE"] = os.path.join(ROOT, "personas.example.json")
+
+import chromadb
+import numpy as np
+from lib.vector_store import ChromaVectorStore, NumpyVectorStore
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def time_queries(store, queries, n_results, batch_size):
+    """Per-query latencies in ms, and the ranked IDs for every query."""
+    latencies, ids = [], []
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        began = time.perf_counter()
+        results = store.query(query_embeddings=batch.tolist() if isinstance(store, ChromaVectorStore) else batch, n_results=n_results)
+        elapsed = (time.perf_counter() - began) * 1000
+        latencies.extend([elapsed / len(batch)] * len(batch))
+        ids.extend(results["ids"])
+    return latencies, ids
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per call for the batched run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((args.chunks, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    # Queries near stored chunks, like real questions about the knowledge base
+    queries = vectors[rng.integers(0, args.chunks, args.queries)] + 0.5 * rng.standard_normal((args.queries, args.dim)).astype(np.float32) / np.sqrt(args.dim)
+    ids = [f"chunk_{i}" for i in range(args.chunks)]
+    documents = [f"Document {i}" for i in range(args.chunks)]
+    metadatas = [{"title": f"Page {i // 5}", "source_url": f"https://www.notion.so/page-{i // 5}"} for i in range(args.chunks)]
+    workdir = tempfile.mkdtemp(prefix="vector-store-bench-")
+    print(f"Benchmarking {args.chunks} chunks x {args.dim} dims, {args.queries} queries, top {args.n_results} (data in {workdir})")
+
+    stores = {}
+    build_seconds = {}
+    began = time.perf_counter()
+    collection = chromadb.PersistentClient(path=os.path.join(workdir, "chroma")).create_collection(
+        "bench-vectors", metadata={"hnsw:space": "cosine"}
+    )
+    for start in range(0, args.chunks, 1000):
+        collection.add(
+            ids=ids[start:start + 1000], embeddings=vectors[start:start + 1000].tolist(),
+            documents=documents[start:start + 1000], metadatas=metadatas[start:start + 1000]
+        )
+    stores["chroma"] = ChromaVectorStore(collection)
+    build_seconds["chroma"] = time.perf_counter() - began
+
+    for dtype in ("float32", "float16"):
+        began = time.perf_counter()
+        path = os.path.join(workdir, f"numpy-{dtype}")
+        writer = NumpyVectorStore(path, metadata={"embedding_dimension": args.dim}, dtype=dtype)
+        writer.upsert(ids, vectors, documents, metadatas)
+        writer.flush()
+        stores[f"numpy-{dtype}"] = NumpyVectorStore(path) # Reopened, so queries run against the memmap
+        build_seconds[f"numpy-{dtype}"] = time.perf_counter() - began
+
+    rankings = {}
+    print(f"\n  {'store':<16}{'build s':>9}{'disk MB':>9}{'p50 ms':>9}{'p99 ms':>9}{'batched ms':>12}{'recall':>8}")
+    for name, store in stores.items():
+        store.query(query_embeddings=queries[:1].tolist(), n_results=args.n_results) # Warm up
+        single, rankings[name] = time_queries(store, queries, args.n_results, 1)
+        batched, _ = time_queries(store, queries, args.n_results, args.batch_size)
+        # Recall@k against the exact float32 results
+        exact = rankings.get("numpy-float32") or time_queries(stores["numpy-float32"], queries, args.n_results, args.batch_size)[1]
+        recall = np.mean([len(set(found) & set(truth)) / len(truth) for found, truth in zip(rankings[name], exact)])
+        print(
+            f"  {name:<16}{build_seconds[name]:>9.2f}{directory_size(os.path.join(workdir, name)) / 1e6:>9.1f}"
+            f"{percentile(single, 0.5):>9.3f}{percentile(single, 0.99):>9.3f}{sum(batched) / len(batched):>12.3f}{recall:>8.3f}"
+        )
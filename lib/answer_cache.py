@@ -0,0 +1,122 @@
+"""
+Semantic answer cache for the Slack bot
+Reuses an earlier answer when the same persona gets a near-identical question
+and retrieval returned the same chunks
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class _Entry:
+    __slots__ = ("persona", "embedding", "chunk_ids", "answer", "created_at")
+
+    def __init__(self, persona, embedding, chunk_ids, answer, created_at):
+        self.persona = persona
+        self.embedding = embedding
+        self.chunk_ids = chunk_ids
+        self.answer = answer
+        self.created_at = created_at
+
+
+class AnswerCache:
+    """LRU + TTL cache of answers, matched by cosine similarity of query embeddings."""
+
+    def __init__(self, similarity_threshold=0.95, max_entries=512, ttl_seconds=3600, sync_marker_path=None):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.sync_marker_path = sync_marker_path
+        self._entries = OrderedDict() # key -> _Entry, least recently used first
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._sync_marker = self._read_sync_marker()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _read_sync_marker(self):
+        if not self.sync_marker_path:
+            return None
+        try:
+            return os.stat(self.sync_marker_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _check_sync_marker(self):
+        """Drops every entry once the knowledge base has been re-synced."""
+        marker = self._read_sync_marker()
+        if marker != self._sync_marker:
+            self._sync_marker = marker
+            if self._entries:
+                self._entries.clear()
+                self.invalidations += 1
+
+    def _expire(self, now):
+        expired = [key for key, entry in self._entries.items() if now - entry.created_at > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        self.evictions += len(expired)
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, persona, embedding, chunk_ids):
+        """Returns a cached answer for this persona/query/context, or None."""
+        query = self._normalize(embedding)
+        chunk_ids = tuple(chunk_ids)
+        with self._lock:
+            self._check_sync_marker()
+            self._expire(time.time())
+
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if entry.persona == persona and entry.chunk_ids == chunk_ids
+            ]
+            if candidates:
+                similarities = np.stack([entry.embedding for _, entry in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry.answer
+
+            self.misses += 1
+            return None
+
+    def store(self, persona, embedding, chunk_ids, answer):
+        """Caches an answer, evicting the least recently used entries past max_entries."""
+        entry = _Entry(persona, self._normalize(embedding), tuple(chunk_ids), answer, time.time())
+        with self._lock:
+            self._check_sync_marker()
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss counters for tuning the similarity threshold."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,97 @@
+"""
+BM25 inverted index over the knowledge base chunks
+Built by sync_notion.py and saved next to the Chroma DB; the bot fuses its ranking
+with the vector search using reciprocal rank fusion
+"""
+
+import json
+import math
+import os
+import re
+import sys
+from collections import Counter, defaultdict
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.metadata_filters import filterable, matches_where
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how i in is it its me my of on or our
+should the their there this to us was we what when where which who why will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lower-cased alphanumeric terms without stopwords (keeps acronyms like soc2 and hipaa)."""
+    return [term for term in re.findall(r"[a-z0-9]+", text.lower()) if term not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 with the per-posting term weights precomputed, so a query is a few dict lookups."""
+
+    def __init__(self, ids, postings, metadatas=None):
+        self.ids = ids # doc number -> chunk ID
+        self.postings = postings # term -> {doc number: BM25 weight}
+        self.metadatas = metadatas # doc number -> filterable metadata; None in indexes saved without it
+        self._doc_numbers = {doc_id: doc for doc, doc_id in enumerate(ids)}
+
+    @classmethod
+    def build(cls, ids, documents, metadatas=None, k1=1.5, b=0.75):
+        term_counts = [Counter(tokenize(document)) for document in documents]
+        lengths = [sum(counts.values()) for counts in term_counts]
+        average_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        document_frequency = Counter(term for counts in term_counts for term in counts)
+
+        postings = defaultdict(dict)
+        for doc, counts in enumerate(term_counts):
+            norm = k1 * (1 - b + b * lengths[doc] / average_length) if average_length else k1
+            for term, tf in counts.items():
+                idf = math.log(1 + (len(documents) - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+                postings[term][doc] = idf * tf * (k1 + 1) / (tf + norm)
+        return cls(list(ids), dict(postings), [filterable(metadata or {}) for metadata in metadatas] if metadatas is not None else None)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, query, k=10, where=None):
+        """
+        Returns up to k (chunk ID, score) pairs, best first. `where` (from build_where) keeps only
+        chunks whose metadata matches, checked in-process; the index must have been built with metadatas.
+        """
+        if where and self.metadatas is None:
+            raise ValueError("This BM25 index has no chunk metadata to filter on; rebuild it with `make sync-notion`")
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            for doc, weight in self.postings.get(term, {}).items():
+                scores[doc] += weight
+        if where:
+            scores = {doc: score for doc, score in scores.items() if matches_where(self.metadatas[doc], where)}
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.ids[doc], score) for doc, score in best]
+
+    def covers(self, doc_id, query):
+        """True if the chunk contains every query term."""
+        doc = self._doc_numbers.get(doc_id)
+        terms = set(tokenize(query))
+        return bool(terms) and all(doc in self.postings.get(term, ()) for term in terms)
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"ids": self.ids, "postings": self.postings, "metadatas": self.metadatas}, file)
+        os.replace(tmp_path, path) # Running bots never see a half-written index
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        # JSON object keys are strings
+        postings = {term: {int(doc): weight for doc, weight in docs.items()} for term, docs in data["postings"].items()}
+        return cls(data["ids"], postings, data.get("metadatas"))
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """Fuses ranked ID lists by summing 1 / (k + rank); returns IDs best first."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)
@@ -0,0 +1,139 @@
+"""
+Structure-aware chunking of page text for sync_notion.py
+Splits the text written by get_text_from_blocks into sections at its markdown headings, packs
+whole blocks (lines, code fences) into chunks of up to a token budget, overlaps consecutive
+chunks of a section and prefixes each chunk with its heading path. The page is tokenized
+once, so chunking is linear in its length.
+"""
+
+import re
+from bisect import bisect_left
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from settings import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from lib.prompt_builder import get_tokenizer
+
+HEADING = re.compile(r"^(#{1,3}) (.+)$")
+FENCE = "```"
+# Chunk fields stored as chunk metadata
+CHUNK_METADATA = ("section", "char_start", "char_end", "token_start", "token_end", "prefix_chars")
+
+
+def _blocks(text):
+    """
+    Yields (start, end, headings, is_heading) for each non-empty line of `text`, with a
+    code fence as one block. `headings` is the heading path the block is under.
+    """
+    headings, fence_start, position = [], None, 0
+    for line in text.split("\n"):
+        start, end, stripped = position, position + len(line), line.strip()
+        position = end + 1
+        if fence_start is not None:
+            if stripped.startswith(FENCE):
+                yield fence_start, end, headings, False
+                fence_start = None
+        elif stripped.startswith(FENCE) and not (len(stripped) > 3 and stripped.endswith(FENCE)):
+            fence_start = start
+        elif HEADING.match(line):
+            level, title = HEADING.match(line).groups()
+            headings = headings[:len(level) - 1] + [title.strip()]
+            yield start, end, headings, True
+        elif stripped:
+            yield start, end, headings, False
+    if fence_start is not None: # Unclosed fence
+        yield fence_start, len(text), headings, False
+
+class _Tokens:
+    """Token positions of a text, from one tokenizer pass."""
+
+    def __init__(self, text):
+        self.text = text
+        self.starts = [start for start, _ in get_tokenizer().encode(text, add_special_tokens=False).offsets]
+
+    def at(self, char):
+        """Index of the first token starting at or after `char`."""
+        return bisect_left(self.starts, char)
+
+    def char(self, token):
+        return self.starts[token] if token < len(self.starts) else len(self.text)
+
+    def word_start(self, low, high):
+        """(token, char) of the last word start after token `low` and up to token `high`, else of token `high`."""
+        low_char, high_char = self.char(low) + 1, self.char(high)
+        space = max(self.text.rfind(" ", low_char, high_char), self.text.rfind("\n", low_char, high_char))
+        return (self.at(space), space + 1) if space >= 0 else (high, high_char) # BPE tokens carry their leading space
+
+def chunk_page(text, title=None, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Chunks a page's text. Returns dicts with the chunk "text" (heading path prefix, then the
+    page text), "section" (its heading path), its "char_start"/"char_end" and
+    "token_start"/"token_end" in the page text, and "prefix_chars" (the prefix's length).
+    Chunks hold up to `max_tokens` tokens of page text; a section that fits in what's left of
+    the current chunk joins it, one that doesn't starts a new chunk, and a section longer than
+    `max_tokens` is split at block (or, inside a long block, word) boundaries with the next
+    chunk repeating the last `overlap_tokens` tokens.
+    """
+    tokens = _Tokens(text)
+    blocks = [(tokens.at(start), tokens.at(end), start, end, headings, is_heading) for start, end, headings, is_heading in _blocks(text)]
+    # Tokens from each heading to the next one of its level or above (its section, with subsections),
+    # to decide whether the section fits in the current chunk
+    section_tokens, next_heading = {}, {}
+    for i in range(len(blocks) - 1, -1, -1):
+        token_start, _, _, _, headings, is_heading = blocks[i]
+        if is_heading:
+            level = len(headings)
+            section_tokens[i] = min([end for at, end in next_heading.items() if at <= level], default=len(tokens.starts)) - token_start
+            next_heading[level] = token_start
+
+    chunks = []
+    start = None # (token, char, headings, starts at its heading) of the chunk being filled
+    section_start = 0 # First token of the current section, which overlaps don't reach back past
+
+    def close(end_token, end_char):
+        token_start, char_start, headings, at_heading = start
+        path = headings[:-1] if at_heading else headings
+        if title and title.lower() != (headings[0].lower() if headings else None): # Pages often open with their title as a heading
+            path = [title] + path
+        prefix = " > ".join(path) + "\n" if path else ""
+        chunks.append({
+            "text": prefix + text[char_start:end_char],
+            "section": " > ".join(headings),
+            "char_start": char_start,
+            "char_end": end_char,
+            "token_start": token_start,
+            "token_end": end_token,
+            "prefix_chars": len(prefix),
+        })
+
+    def resume(end_token, end_char, headings):
+        """Start of the chunk after one ending at `end_token`: `overlap_tokens` back, at a word, within the section."""
+        floor = max(start[0], section_start)
+        target = end_token - overlap_tokens
+        if overlap_tokens <= 0 or target <= floor:
+            return (end_token, end_char, headings, False)
+        return (*tokens.word_start(max(floor, target - overlap_tokens), target), headings, False)
+
+    previous_end = None # (token, char) where the last block added ends
+    has_body = False # Whether the chunk being filled has more than headings
+    for i, (token_start, token_end, char_start, char_end, headings, is_heading) in enumerate(blocks):
+        if is_heading:
+            section_start = token_start
+        if start is not None:
+            needed = section_tokens[i] if is_heading else token_end - token_start
+            if has_body and token_start - start[0] + needed > max_tokens:
+                close(*previous_end)
+                start, has_body = None if is_heading else resume(*previous_end, headings), False
+        if start is None or start[0] >= previous_end[0]: # Nothing carried over: start at this block
+            start = (token_start, char_start, headings, is_heading)
+        has_body = has_body or not is_heading
+        # A block longer than the budget is cut at a word boundary
+        while token_end - start[0] > max_tokens:
+            cut = tokens.word_start(start[0] + max_tokens // 2, start[0] + max_tokens)
+            close(*cut)
+            start = resume(*cut, headings)
+        previous_end = (token_end, char_end)
+
+    if start is not None:
+        close(*previous_end)
+    return chunks
@@ -0,0 +1,107 @@
+"""
+Post-retrieval context assembly
+Diversifies the over-fetched candidates with maximal marginal relevance, then merges
+adjacent chunks of the same page into one span and writes one source line per page.
+"""
+
+import numpy as np
+
+
+def mmr(candidates, vectors, k, lambda_=0.7):
+    """
+    Picks k of the best-first `candidates`, trading relevance (from their rank) against
+    similarity to the ones already picked. `vectors` are the candidates' embeddings.
+    """
+    if len(candidates) <= k:
+        return list(candidates)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    similarity = vectors @ vectors.T
+    relevance = 1.0 - np.arange(len(candidates)) / len(candidates)
+
+    selected = [0]
+    redundancy = similarity[0].copy() # Highest similarity to anything picked so far
+    while len(selected) < k:
+        scores = lambda_ * relevance - (1 - lambda_) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return [candidates[i] for i in selected]
+
+def split_chunk_id(chunk_id):
+    """(page ID, window number) for the `{page_id}_{i}` IDs written by sync_notion.py."""
+    page_id, _, index = chunk_id.rpartition("_")
+    return (page_id, int(index)) if page_id and index.isdigit() else (chunk_id, 0)
+
+def _join(span, previous, chunk):
+    """Appends a chunk to the span ending with `previous`, the page's window before it."""
+    metadata, before = chunk["metadata"], previous["metadata"]
+    if "char_start" not in metadata or "char_end" not in before: # Synced before chunks overlapped
+        return span + chunk["document"]
+    text = chunk["document"][metadata.get("prefix_chars", 0):] # Its heading path is already in the span
+    overlap = before["char_end"] - metadata["char_start"]
+    return span + text[overlap:] if overlap >= 0 else span + "\n" + text
+
+def _merge(chunks):
+    """merge_adjacent, with each span as (rank, span): the best rank of the chunks in it."""
+    pages = {}
+    for rank, chunk in enumerate(chunks):
+        page_id, index = split_chunk_id(chunk["id"])
+        page = pages.setdefault(page_id, {"metadata": chunk["metadata"], "windows": {}})
+        page["windows"][index] = (rank, chunk)
+
+    merged = []
+    for page in pages.values():
+        spans, previous = [], None
+        for index in sorted(page["windows"]):
+            rank, chunk = page["windows"][index]
+            if previous is not None and index == previous + 1:
+                best, span = spans[-1]
+                spans[-1] = (min(best, rank), _join(span, page["windows"][previous][1], chunk))
+            else:
+                spans.append((rank, chunk["document"]))
+            previous = index
+        merged.append((page["metadata"], spans))
+    return merged
+
+def merge_adjacent(chunks):
+    """
+    Groups chunks by page, in the order each page first appears, and joins consecutive
+    windows of a page into one span. Returns [(metadata, [span, ...])].
+    """
+    return [(metadata, [span for _, span in spans]) for metadata, spans in _merge(chunks)]
+
+def _unique_spans(chunks):
+    """_merge, without spans whose text already appeared; pages left with no spans are dropped."""
+    seen = set()
+    for metadata, spans in _merge(chunks):
+        unique = []
+        for rank, span in spans:
+            key = " ".join(span.lower().split())
+            if key and key not in seen:
+                seen.add(key)
+                unique.append((rank, span.strip()))
+        if unique:
+            yield metadata, unique
+
+def format_context(chunks):
+    """The prompt context for best-first chunks: each page's source once, then its spans, without repeated text."""
+    context = "Context from Notion:\n"
+    for metadata, spans in _unique_spans(chunks):
+        context += f"- Source: {metadata['title']} ({metadata['source_url']})\n"
+        for _, span in spans:
+            context += f"  Content: {span}\n\n"
+    return context
+
+def context_chunks(chunks):
+    """
+    The prompt context for best-first chunks as separate pieces, one per page span with its
+    page's source, ordered by their best chunk so a token budget drops the lowest-ranked first.
+    """
+    spans = [
+        (rank, f"- Source: {metadata['title']} ({metadata['source_url']})\n  Content: {span}")
+        for metadata, page_spans in _unique_spans(chunks)
+        for rank, span in page_spans
+    ]
+    return [span for _, span in sorted(spans, key=lambda span: span[0])]
@@ -0,0 +1,95 @@
+"""
+Idempotency and request coalescing for the Slack bot
+Drops redelivered Slack events and shares one completion between identical in-flight requests
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class TTLKeyStore:
+    """Remembers keys for a bounded time, capped at max_keys (oldest dropped first)."""
+
+    def __init__(self, ttl_seconds=600, max_keys=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self._keys = OrderedDict() # key -> expiry, in insertion (and so expiry) order
+        self._lock = threading.Lock()
+
+    def check_and_add(self, key):
+        """Returns True if the key was already seen, otherwise records it and returns False."""
+        now = time.monotonic()
+        with self._lock:
+            while self._keys and next(iter(self._keys.values())) <= now:
+                self._keys.popitem(last=False)
+            if key in self._keys:
+                return True
+            self._keys[key] = now + self.ttl_seconds
+            while len(self._keys) > self.max_keys:
+                self._keys.popitem(last=False)
+            return False
+
+
+class SingleFlight:
+    """Runs one call per key at a time; callers arriving meanwhile wait for and share its result."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.shared = 0
+
+    def do(self, key, fn, *args):
+        """Returns (result, shared) where shared is True if another caller's result was reused."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.shared += 1
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn(*args)
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """asyncio variant of SingleFlight; fn must be a coroutine function."""
+
+    def __init__(self):
+        self._calls = {}
+        self.shared = 0
+
+    async def do(self, key, fn, *args):
+        future = self._calls.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future), True
+
+        future = self._calls[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await fn(*args)
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # Mark as retrieved, there may be no one waiting
+            raise
+        finally:
+            del self._calls[key]
@@ -0,0 +1,270 @@
+"""
+Embedding caches
+EmbeddingCache: query embeddings, an in-memory LRU in front of a SQLite table of float32
+vectors, keyed on the embedding model and the normalised query text.
+EmbeddingStore: document (chunk) embeddings, content-addressed by model, dimension and text,
+so syncs, rebuilds and evals never pay twice for the same text. Run as a script to export
+or import it:
+
+    python lib/embedding_cache.py export embeddings.sqlite3 [--model openai:text-embedding-3-small]
+    python lib/embedding_cache.py import embeddings.sqlite3
+    python lib/embedding_cache.py stats
+"""
+
+import argparse
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalise_query(text):
+    """Case- and whitespace-insensitive form of a query, used as the cache key."""
+    return " ".join(text.lower().split())
+
+
+class EmbeddingCache:
+    """Two-tier (memory LRU, then SQLite) cache of query embeddings."""
+
+    def __init__(self, path, max_memory_entries=1024, max_disk_entries=100000):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict() # key -> embedding
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL") # Several bot processes can share the file
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS query_embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, query TEXT NOT NULL, "
+            "vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS query_embeddings_last_used ON query_embeddings (last_used)")
+        self._disk_size = self._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+
+    @staticmethod
+    def _key(model, query):
+        return hashlib.sha1(f"{model}\n{query}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, embedding):
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model, text):
+        """Returns (embedding, tier) where tier is "memory", "disk" or None on a miss."""
+        key = self._key(model, normalise_query(text))
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return embedding, "memory"
+
+            row = self._db.execute("SELECT vector FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None, None
+            self._db.execute("UPDATE query_embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+            embedding = np.frombuffer(row[0], dtype=np.float32).tolist()
+            self._remember(key, embedding)
+            self.disk_hits += 1
+            return embedding, "disk"
+
+    def put(self, model, text, embedding):
+        query = normalise_query(text)
+        key = self._key(model, query)
+        vector = np.asarray(embedding, dtype=np.float32).tobytes()
+        with self._lock:
+            self._remember(key, list(embedding))
+            inserted = self._db.execute(
+                "INSERT OR IGNORE INTO query_embeddings (key, model, query, vector, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, model, query, vector, time.time())
+            ).rowcount
+            self._disk_size += inserted
+            if self._disk_size > self.max_disk_entries:
+                # Drop the least recently used rows
+                excess = self._disk_size - self.max_disk_entries
+                self._db.execute(
+                    "DELETE FROM query_embeddings WHERE key IN "
+                    "(SELECT key FROM query_embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._disk_size -= excess
+                self.evictions += excess
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM query_embeddings")
+            self._disk_size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_size": len(self._memory),
+                "disk_size": self._disk_size,
+                "evictions": self.evictions,
+            }
+
+
+class EmbeddingStore:
+    """
+    SQLite table of float32 document embeddings keyed by sha256(model, dimension, text).
+    Holds at most `max_bytes` of vectors; past that the least recently used are evicted.
+    """
+
+    def __init__(self, path, max_bytes=2 * 1024 ** 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS document_embeddings ("
+            "key BLOB PRIMARY KEY, model TEXT NOT NULL, dimension INTEGER NOT NULL, "
+            "vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS document_embeddings_last_used ON document_embeddings (last_used)")
+        self._size = self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM document_embeddings").fetchone()[0]
+
+    @staticmethod
+    def _key(model, dimension, text):
+        return hashlib.sha256(f"{model}\n{dimension}\n{text}".encode("utf-8")).digest()
+
+    def get_many(self, model, dimension, texts):
+        """The stored embedding for each text, or None where there isn't one."""
+        keys = [self._key(model, dimension, text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500): # SQLite caps the parameters per statement
+                batch = keys[start:start + 500]
+                found.update(self._db.execute(
+                    f"SELECT key, vector FROM document_embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE document_embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [np.frombuffer(found[key], dtype=np.float32).tolist() if key in found else None for key in keys]
+
+    def put_many(self, model, dimension, texts, embeddings):
+        now = time.time()
+        rows = [
+            (self._key(model, dimension, text), model, dimension, np.asarray(embedding, dtype=np.float32).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                added = sum(
+                    len(row[3]) * self._db.execute(
+                        "INSERT OR IGNORE INTO document_embeddings (key, model, dimension, vector, last_used) VALUES (?, ?, ?, ?, ?)", row
+                    ).rowcount
+                    for row in rows
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._size += added
+            self._evict()
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        # Down to 90% of the limit, so the next few writes don't each trigger an eviction
+        excess, keys = self._size - int(self.max_bytes * 0.9), []
+        for key, size in self._db.execute("SELECT key, LENGTH(vector) FROM document_embeddings ORDER BY last_used"):
+            keys.append(key)
+            excess -= size
+            self._size -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM document_embeddings WHERE key = ?", [(key,) for key in keys])
+        self.evictions += len(keys)
+
+    def export_to(self, path, model=None):
+        """Copies the stored embeddings (of one model, if given) into a new store file at `path`; returns how many."""
+        EmbeddingStore(path, self.max_bytes)._db.close() # Creates the table
+        with self._lock:
+            self._db.execute("ATTACH DATABASE ? AS target", (path,))
+            try:
+                return self._db.execute(
+                    "INSERT OR IGNORE INTO target.document_embeddings SELECT * FROM document_embeddings"
+                    + (" WHERE model = ?" if model else ""), (model,) if model else ()
+                ).rowcount
+            finally:
+                self._db.execute("DETACH DATABASE target")
+
+    def import_from(self, path):
+        """Adds the embeddings from an exported store file that this one doesn't have; returns how many."""
+        with self._lock:
+            self._db.execute("ATTACH DATABASE ? AS source", (path,))
+            try:
+                added = self._db.execute(
+                    "INSERT OR IGNORE INTO document_embeddings SELECT * FROM source.document_embeddings"
+                ).rowcount
+            finally:
+                self._db.execute("DETACH DATABASE source")
+            self._size = self._db.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM document_embeddings").fetchone()[0]
+            self._evict()
+            return added
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": self._db.execute("SELECT COUNT(*) FROM document_embeddings").fetchone()[0],
+                "megabytes": self._size / 1024 ** 2,
+                "evictions": self.evictions,
+            }
+
+
+if __name__ == "__main__":
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from settings import EMBEDDING_STORE_MAX_MB, EMBEDDING_STORE_PATH
+
+    parser = argparse.ArgumentParser(description="Exports or imports the document embedding store, e.g. to seed CI or a dev machine from production.")
+    parser.add_argument("command", choices=["export", "import", "stats"])
+    parser.add_argument("file", nargs="?", help="Store file to export to or import from")
+    parser.add_argument("--model", help="Export only this provider's embeddings, e.g. openai:text-embedding-3-small")
+    args = parser.parse_args()
+    if args.command != "stats" and not args.file:
+        parser.error(f"{args.command} needs a file")
+
+    store = EmbeddingStore(EMBEDDING_STORE_PATH, max_bytes=EMBEDDING_STORE_MAX_MB * 1024 ** 2)
+    if args.command == "export":
+        print(f"Exported {store.export_to(args.file, args.model)} embeddings from {EMBEDDING_STORE_PATH} to {args.file}")
+    elif args.command == "import":
+        print(f"Imported {store.import_from(args.file)} new embeddings from {args.file} into {EMBEDDING_STORE_PATH}")
+    stats = store.stats()
+    print(f"{EMBEDDING_STORE_PATH}: {stats['entries']} embeddings, {stats['megabytes']:.1f} MB")
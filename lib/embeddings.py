@@ -0,0 +1,265 @@
+"""
+Embedding helpers shared by the bot and the sync scripts
+EMBEDDING_PROVIDER selects OpenAI's API or a local ONNX sentence-embedding model;
+collections record which provider made their vectors so sync and query never mix them
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import openai
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from settings import (
+    EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_MEMORY_ENTRIES, EMBEDDING_CACHE_PATH,
+    EMBEDDING_MAX_RETRIES, EMBEDDING_MODEL, EMBEDDING_PROVIDER, EMBEDDING_QUERY_MAX_DELAY_SECONDS, EMBEDDING_QUERY_MAX_RETRIES,
+    EMBEDDING_RETRY_BASE_SECONDS, EMBEDDING_STORE_ENABLED,
+    EMBEDDING_STORE_MAX_MB, EMBEDDING_STORE_PATH, OPENAI_API_KEY,
+    ONNX_EMBEDDING_BATCH_SIZE, ONNX_EMBEDDING_MAX_LENGTH, ONNX_EMBEDDING_MODEL_DIR, ONNX_EMBEDDING_WORKERS
+)
+from lib.embedding_cache import EmbeddingCache, EmbeddingStore
+from lib.retry import call_with_retry
+from lib.telemetry import register_gauge, set_attributes
+
+log = logging.getLogger(__name__)
+openai.api_key = OPENAI_API_KEY
+# Collections synced before providers were recorded were embedded with this
+LEGACY_PROVIDER_NAME = "openai:text-embedding-3-small"
+
+_providers = {}
+_providers_lock = threading.Lock()
+_query_cache = None
+_query_cache_lock = threading.Lock()
+_document_store = None
+
+
+# --- Providers ---
+class OpenAIEmbeddingProvider:
+    """Embeddings from the OpenAI API."""
+
+    DIMENSIONS = {"text-embedding-3-small": 1536, "text-embedding-3-large": 3072, "text-embedding-ada-002": 1536}
+
+    def __init__(self, model=EMBEDDING_MODEL):
+        self.model = model
+        self.name = f"openai:{model}"
+        self.max_input_tokens = 8191 # Longer inputs are rejected
+        self._dimension = self.DIMENSIONS.get(model)
+
+    @property
+    def dimension(self):
+        if self._dimension is None:
+            self._dimension = len(self.embed(["dimension"])[0])
+        return self._dimension
+
+    def embed(self, texts, retries=EMBEDDING_MAX_RETRIES, max_delay=60.0):
+        """Embeds a list of texts in one request and returns the vectors in input order."""
+        response = call_with_retry(
+            openai.embeddings.create, input=texts, model=self.model,
+            retries=retries, base_delay=EMBEDDING_RETRY_BASE_SECONDS, max_delay=max_delay
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def embed_queries(self, texts):
+        """embed() for search queries: a mention is waiting, so it fails fast rather than backing off for long."""
+        return self.embed(texts, retries=EMBEDDING_QUERY_MAX_RETRIES, max_delay=EMBEDDING_QUERY_MAX_DELAY_SECONDS)
+
+
+class OnnxEmbeddingProvider:
+    """
+    Local sentence embeddings on CPU with onnxruntime. `model_dir` holds model.onnx and
+    tokenizer.json (e.g. an exported all-MiniLM-L6-v2). Texts are embedded in batches,
+    spread over a thread pool; vectors are mean-pooled and L2-normalised.
+    """
+
+    def __init__(self, model_dir=ONNX_EMBEDDING_MODEL_DIR, batch_size=ONNX_EMBEDDING_BATCH_SIZE,
+                 workers=ONNX_EMBEDDING_WORKERS, max_length=ONNX_EMBEDDING_MAX_LENGTH):
+        self.model_dir = model_dir
+        self.name = f"onnx:{os.path.basename(os.path.normpath(model_dir))}"
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_length = max_length
+        self.max_input_tokens = max_length - 2 # Less [CLS] and [SEP]; longer texts are truncated
+        self._session = None
+        self._tokenizer = None
+        self._pool = None
+        self._dimension = None
+        self._load_lock = threading.Lock()
+
+    def _load(self):
+        if self._session is None:
+            with self._load_lock:
+                if self._session is None:
+                    import onnxruntime
+                    from tokenizers import Tokenizer
+
+                    tokenizer = Tokenizer.from_file(os.path.join(self.model_dir, "tokenizer.json"))
+                    tokenizer.enable_truncation(max_length=self.max_length)
+                    tokenizer.enable_padding(pad_id=tokenizer.token_to_id("[PAD]") or 0)
+
+                    options = onnxruntime.SessionOptions()
+                    # Split the cores between the batches that run at the same time
+                    options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // self.workers)
+                    session = onnxruntime.InferenceSession(
+                        os.path.join(self.model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+                    )
+                    self._input_names = {model_input.name for model_input in session.get_inputs()}
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="onnx-embed")
+                    self._tokenizer = tokenizer
+                    self._session = session
+
+    @property
+    def dimension(self):
+        if self._dimension is None:
+            self._dimension = len(self.embed(["dimension"])[0])
+        return self._dimension
+
+    def _embed_batch(self, texts):
+        encodings = self._tokenizer.encode_batch(texts)
+        truncated = sum(1 for encoding in encodings if encoding.overflowing)
+        if truncated:
+            log.warning(f"{truncated} of {len(texts)} texts were longer than {self.max_length} tokens and were truncated before embedding")
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        inputs = {
+            "input_ids": np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+            "token_type_ids": np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        output = self._session.run(None, {name: value for name, value in inputs.items() if name in self._input_names})[0]
+        if output.ndim == 3:
+            # Token embeddings: mean over the non-padding tokens
+            mask = attention_mask[:, :, None].astype(np.float32)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return (output / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def embed(self, texts):
+        self._load()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        if len(batches) == 1:
+            results = [self._embed_batch(batches[0])]
+        else:
+            results = list(self._pool.map(self._embed_batch, batches))
+        return np.concatenate(results).tolist() if results else []
+
+
+PROVIDERS = {
+    "openai": OpenAIEmbeddingProvider,
+    "onnx": OnnxEmbeddingProvider,
+}
+
+def get_embedding_provider(name=EMBEDDING_PROVIDER):
+    """Returns the shared provider for a name in PROVIDERS."""
+    with _providers_lock:
+        if name not in _providers:
+            if name not in PROVIDERS:
+                raise ValueError(f"Unknown EMBEDDING_PROVIDER {name!r}, expected one of {', '.join(PROVIDERS)}")
+            _providers[name] = PROVIDERS[name]()
+        return _providers[name]
+
+
+# --- Collections ---
+def collection_metadata(provider=None):
+    """Chroma collection metadata recording which provider produced the vectors."""
+    provider = provider or get_embedding_provider()
+    return {"embedding_provider": provider.name, "embedding_dimension": provider.dimension}
+
+def check_collection(collection, provider=None):
+    """Raises if the collection's vectors came from a different provider than the one configured."""
+    provider = provider or get_embedding_provider()
+    metadata = collection.metadata or {}
+    stored = metadata.get("embedding_provider", LEGACY_PROVIDER_NAME)
+    if stored != provider.name:
+        raise RuntimeError(
+            f"Collection '{collection.name}' was embedded with {stored} but EMBEDDING_PROVIDER gives {provider.name}; "
+            f"re-sync into a new collection (or delete {collection.name}) before switching providers"
+        )
+    dimension = metadata.get("embedding_dimension")
+    if dimension is not None and dimension != provider.dimension:
+        raise RuntimeError(
+            f"Collection '{collection.name}' holds {dimension}-dimensional vectors but {provider.name} produces {provider.dimension}"
+        )
+
+
+# --- Embedding ---
+def get_query_cache():
+    """The process-wide query embedding cache, or None when EMBEDDING_CACHE_ENABLED is off."""
+    global _query_cache
+    if EMBEDDING_CACHE_ENABLED and _query_cache is None:
+        with _query_cache_lock:
+            if _query_cache is None:
+                _query_cache = EmbeddingCache(
+                    EMBEDDING_CACHE_PATH,
+                    max_memory_entries=EMBEDDING_CACHE_MEMORY_ENTRIES,
+                    max_disk_entries=EMBEDDING_CACHE_MAX_ENTRIES
+                )
+                register_gauge("embedding_cache.hit_rate", lambda: _query_cache.stats()["hit_rate"])
+    return _query_cache
+
+def get_document_store():
+    """The process-wide document embedding store, or None when EMBEDDING_STORE_ENABLED is off."""
+    global _document_store
+    if EMBEDDING_STORE_ENABLED and _document_store is None:
+        with _query_cache_lock:
+            if _document_store is None:
+                _document_store = EmbeddingStore(EMBEDDING_STORE_PATH, max_bytes=EMBEDDING_STORE_MAX_MB * 1024 ** 2)
+    return _document_store
+
+def embed_texts(texts, provider=None):
+    """Embeds a list of texts and returns the vectors in input order."""
+    return (provider or get_embedding_provider()).embed(texts)
+
+def embed_documents(texts, provider=None):
+    """Embeds document chunks, reusing every vector the embedding store has for the same model and text."""
+    provider = provider or get_embedding_provider()
+    store = get_document_store()
+    if store is None:
+        return provider.embed(list(texts)) if texts else []
+
+    embeddings = store.get_many(provider.name, provider.dimension, texts)
+    misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if misses:
+        fresh = provider.embed([texts[i] for i in misses])
+        store.put_many(provider.name, provider.dimension, [texts[i] for i in misses], fresh)
+        for i, embedding in zip(misses, fresh):
+            embeddings[i] = embedding
+    return embeddings
+
+def _embed_queries(provider, texts):
+    """The provider's embed_queries() if it retries queries differently, else embed()."""
+    return getattr(provider, "embed_queries", provider.embed)(texts)
+
+def embed_query(text, provider=None):
+    """Embeds a single query string, reusing cached embeddings of the same normalised query."""
+    provider = provider or get_embedding_provider()
+    cache = get_query_cache()
+    if cache is None:
+        return _embed_queries(provider, [text])[0]
+
+    embedding, tier = cache.get(provider.name, text)
+    set_attributes(embedding_cache=tier or "miss")
+    if embedding is None:
+        embedding = _embed_queries(provider, [text])[0]
+        cache.put(provider.name, text, embedding)
+    return embedding
+
+def embed_queries(texts, provider=None):
+    """Embeds several query strings, sending every cache miss in one batched request."""
+    provider = provider or get_embedding_provider()
+    cache = get_query_cache()
+    if cache is None:
+        return _embed_queries(provider, list(texts)) if texts else []
+
+    embeddings, misses = [], []
+    for i, text in enumerate(texts):
+        embedding, _ = cache.get(provider.name, text)
+        embeddings.append(embedding)
+        if embedding is None:
+            misses.append(i)
+    set_attributes(embedding_cache_hits=len(texts) - len(misses), embedding_cache_misses=len(misses))
+    if misses:
+        for i, embedding in zip(misses, _embed_queries(provider, [texts[i] for i in misses])):
+            embeddings[i] = embedding
+            cache.put(provider.name, texts[i], embedding)
+    return embeddings
@@ -0,0 +1,95 @@
+"""
+Chunk metadata from Notion page properties, and persona filters over it
+Select properties are stored as plain values; multi-select properties (e.g. Department)
+as one boolean flag per option, since Chroma metadata values must be scalars.
+"""
+
+import re
+
+# Notion property -> (metadata key, property type); see knowledge_base.yaml
+PAGE_PROPERTIES = {
+    "Category": ("category", "select"),
+    "Subcategory": ("subcategory", "select"),
+    "Department": ("department", "multi_select"),
+    "Document Type": ("document_type", "select"),
+    "Priority": ("priority", "select"),
+    "Status": ("status", "select"),
+}
+_BY_KEY = {key: (key, property_type) for key, property_type in PAGE_PROPERTIES.values()}
+
+
+def _slug(value):
+    return re.sub(r"[^a-z0-9]+", "_", value.lower()).strip("_")
+
+def flag_key(key, option):
+    """Metadata key flagging one option of a multi-select property, e.g. department_customer_success."""
+    return f"{key}_{_slug(option)}"
+
+def page_metadata(page):
+    """Chunk metadata for the properties of a Notion database page that are set."""
+    metadata = {}
+    for name, (key, property_type) in PAGE_PROPERTIES.items():
+        prop = page.get("properties", {}).get(name) or {}
+        if property_type == "select" and prop.get("select"):
+            metadata[key] = prop["select"]["name"]
+        elif property_type == "multi_select" and prop.get("multi_select"):
+            options = [option["name"] for option in prop["multi_select"]]
+            metadata[key] = ", ".join(options) # For display; filters use the flags
+            metadata.update((flag_key(key, option), True) for option in options)
+    return metadata
+
+def filterable(metadata):
+    """The part of a chunk's metadata that build_where filters on (select values and multi-select flags)."""
+    flags = tuple(f"{key}_" for key, property_type in PAGE_PROPERTIES.values() if property_type == "multi_select")
+    return {
+        key: value for key, value in metadata.items()
+        if (key in _BY_KEY and _BY_KEY[key][1] == "select") or key.startswith(flags)
+    }
+
+
+def _combine(operator, clauses):
+    # Chroma wants at least two clauses under $and / $or
+    return clauses[0] if len(clauses) == 1 else {operator: clauses}
+
+def build_where(filters):
+    """
+    Translates persona filters, e.g. {"Department": ["Executive", "Sales"], "Status": "Approved"},
+    into a Chroma `where` clause. A list matches any of its values. Returns None for no filters.
+    """
+    clauses = []
+    for name, values in (filters or {}).items():
+        key, property_type = PAGE_PROPERTIES.get(name) or _BY_KEY.get(name) or (None, None)
+        if key is None:
+            raise ValueError(f"Unknown filter property {name!r}, expected one of {', '.join(PAGE_PROPERTIES)}")
+        values = values if isinstance(values, list) else [values]
+        if property_type == "multi_select":
+            clauses.append(_combine("$or", [{flag_key(key, value): True} for value in values]))
+        elif len(values) == 1:
+            clauses.append({key: values[0]})
+        else:
+            clauses.append({key: {"$in": values}})
+    return _combine("$and", clauses) if clauses else None
+
+def matches_where(metadata, where):
+    """Evaluates the subset of Chroma's `where` syntax that build_where produces against one chunk's metadata."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            matched = all(matches_where(metadata, clause) for clause in condition)
+        elif key == "$or":
+            matched = any(matches_where(metadata, clause) for clause in condition)
+        elif isinstance(condition, dict):
+            operator, value = next(iter(condition.items()))
+            actual = metadata.get(key)
+            matched = {
+                "$eq": lambda: actual == value,
+                "$ne": lambda: actual != value,
+                "$in": lambda: actual in value,
+                "$nin": lambda: actual not in value,
+            }[operator]()
+        else:
+            matched = metadata.get(key) == condition
+        if not matched:
+            return False
+    return True
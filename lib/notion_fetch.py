@@ -0,0 +1,100 @@
+"""
+Notion API reads for sync_notion.py
+Follows has_more/next_cursor on every list and walks nested blocks (toggles, columns,
+nested lists). Every request, from however many threads, is paced by a token bucket
+held to Notion's rate limit and retried on 429s and server errors.
+"""
+
+import threading
+import time
+import httpx
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from settings import NOTION_MAX_RETRIES, NOTION_REQUESTS_PER_SECOND
+from lib.retry import call_with_retry, retry_after
+
+# Blocks whose children are other pages or databases, not part of the page's own text
+SEPARATE_PAGE_BLOCKS = {"child_page", "child_database"}
+
+
+class TokenBucket:
+    """Thread-safe rate limiter: acquire() blocks until a request may go out at `rate` per second, bursting up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        with self._lock:
+            self._refill()
+            self._tokens -= 1 # Reserve a token now and wait for it outside the lock, so waiters go out in order
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Holds every caller back for `seconds`, e.g. after a 429's Retry-After."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+def is_retryable(error):
+    """True for Notion errors worth retrying: 429, 5xx, timeouts and connection failures."""
+    if isinstance(error, (RequestTimeoutError, httpx.TransportError)):
+        return True
+    return isinstance(error, HTTPResponseError) and (error.status == 429 or error.status >= 500)
+
+class NotionFetcher:
+    """Paginated, rate-limited reads through a notion_client.Client, safe to share between threads."""
+
+    def __init__(self, client, rate=NOTION_REQUESTS_PER_SECOND, retries=NOTION_MAX_RETRIES):
+        self.client = client
+        self.limiter = TokenBucket(rate)
+        self.retries = retries
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def _request(self, method, **kwargs):
+        def attempt():
+            self.limiter.acquire()
+            with self._lock:
+                self.requests += 1
+            try:
+                return method(**kwargs)
+            except HTTPResponseError as e:
+                if e.status == 429: # The limit is per integration, so every worker backs off
+                    self.limiter.pause(retry_after(e) or 1.0)
+                raise
+        return call_with_retry(attempt, retries=self.retries, retryable=is_retryable)
+
+    def _paginate(self, method, **kwargs):
+        """Yields every result of a paginated endpoint, requesting the next page only when it is needed."""
+        cursor = None
+        while True:
+            response = self._request(method, page_size=100, **kwargs, **({"start_cursor": cursor} if cursor else {}))
+            yield from response["results"]
+            if not response.get("has_more"):
+                return
+            cursor = response["next_cursor"]
+
+    def iter_database(self, database_id):
+        """Yields every page in the database."""
+        return self._paginate(self.client.databases.query, database_id=database_id)
+
+    def get_blocks(self, block_id):
+        """Every block under `block_id`; blocks with children get them, recursively, as block["children"]."""
+        blocks = list(self._paginate(self.client.blocks.children.list, block_id=block_id))
+        for block in blocks:
+            if block.get("has_children") and block.get("type") not in SEPARATE_PAGE_BLOCKS:
+                block["children"] = self.get_blocks(block["id"])
+        return blocks
@@ -1,38 +1,183 @@
-import chromadb
-import openai
+import logging
+import threading
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from settings import CHROMA_DB_PATH, CHROMA_COLLECTION_NAME, OPENAI_API_KEY
+from settings import (
+    BM25_INDEX_PATH, HYBRID_CANDIDATES, HYBRID_RETRIEVAL_ENABLED,
+    LEXICAL_SHORTCUT_RATIO, MMR_CANDIDATES, MMR_ENABLED, MMR_LAMBDA, RRF_K
+)
+from lib.bm25 import BM25Index, reciprocal_rank_fusion
+from lib.context_assembly import format_context, mmr
+from lib.embeddings import embed_queries
+from lib.metadata_filters import build_where
+from lib.telemetry import set_attributes, stage
+from lib.vector_store import open_vector_store
 
 # --- Initialization in your bot file ---
-openai.api_key = OPENAI_API_KEY
-chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH) # Connect to the same local folder
-collection = chroma_client.get_collection(name=CHROMA_COLLECTION_NAME)
+log = logging.getLogger(__name__)
+_collection = None
+_collection_lock = threading.Lock()
+_bm25_index = None
+_bm25_mtime = None
+_bm25_lock = threading.Lock()
+
+def get_collection():
+    """Opens the vector store on first use (the same one sync_notion.py writes)."""
+    global _collection
+    if _collection is None:
+        with _collection_lock:
+            if _collection is None:
+                _collection = open_vector_store()
+    return _collection
+
+def get_bm25_index():
+    """Loads the BM25 index written by sync_notion.py, reloading it after a re-sync. None if there is none."""
+    global _bm25_index, _bm25_mtime
+    if not HYBRID_RETRIEVAL_ENABLED:
+        return None
+    try:
+        mtime = os.stat(BM25_INDEX_PATH).st_mtime_ns
+    except FileNotFoundError:
+        if _bm25_mtime != "missing":
+            log.warning(f"No BM25 index at {BM25_INDEX_PATH}, using vector search only until the next `make sync-notion`")
+            _bm25_mtime = "missing"
+        return None
+    if mtime != _bm25_mtime:
+        with _bm25_lock:
+            if mtime != _bm25_mtime:
+                _bm25_index = BM25Index.load(BM25_INDEX_PATH)
+                if _bm25_index.metadatas is None:
+                    log.warning(f"{BM25_INDEX_PATH} has no chunk metadata, so filtered searches check BM25 hits against the vector store until the next `make sync-notion`")
+                _bm25_mtime = mtime
+    return _bm25_index
+
+def is_conclusive(index, query, lexical):
+    """True when the top BM25 hit has every query term and clearly beats the runner-up."""
+    if not LEXICAL_SHORTCUT_RATIO or not lexical or not index.covers(lexical[0][0], query):
+        return False
+    return len(lexical) == 1 or lexical[0][1] >= LEXICAL_SHORTCUT_RATIO * lexical[1][1]
+
+def _include():
+    # MMR compares candidates by their stored embeddings
+    return ["documents", "metadatas", "embeddings"] if MMR_ENABLED else ["documents", "metadatas"]
+
+def _chunks(ids, documents, metadatas, embeddings=None):
+    return [
+        {"id": chunk_id, "document": document, "metadata": metadata, "embedding": embedding}
+        for chunk_id, document, metadata, embedding in zip(ids, documents, metadatas, embeddings if embeddings is not None else [None] * len(ids))
+    ]
+
+def _get_chunks(collection, ids):
+    """Fetches chunks by ID, in the order given."""
+    if not ids:
+        return []
+    found = collection.get(ids=ids, include=_include())
+    chunks = {chunk["id"]: chunk for chunk in _chunks(found['ids'], found['documents'], found['metadatas'], found.get('embeddings'))}
+    return [chunks[chunk_id] for chunk_id in ids if chunk_id in chunks]
+
+def diversify(candidates, n_results):
+    """Picks n_results of the best-first candidates with MMR (or the top n_results when MMR_ENABLED is off)."""
+    picked = candidates[:n_results]
+    if MMR_ENABLED and len(candidates) > n_results:
+        with stage("retrieval.mmr", candidates=len(candidates)):
+            picked = mmr(candidates, [chunk["embedding"] for chunk in candidates], n_results, MMR_LAMBDA)
+    return [{key: chunk[key] for key in ("id", "document", "metadata")} for chunk in picked]
+
+def _allowed(collection, lexical, where):
+    """
+    Drops BM25 hits whose chunks don't match the metadata filter, with one lookup for every
+    query. Only for indexes saved without chunk metadata, which filter in-process otherwise.
+    """
+    ids = list(dict.fromkeys(chunk_id for hits in lexical for chunk_id, _ in hits))
+    if not ids:
+        return lexical
+    allowed = set(collection.get(ids=ids, where=where, include=[])['ids'])
+    return [[(chunk_id, score) for chunk_id, score in hits if chunk_id in allowed] for hits in lexical]
+
+def retrieve_many(queries, k=3, filters=None):
+    """
+    Retrieves for several queries at once: one batched embeddings request for the queries
+    that need one, and one multi-vector query. Returns a list (one per query) of the k most
+    relevant chunks as {"id", "document", "metadata"} dicts, fusing BM25 and vector rankings
+    when a BM25 index is available. `filters` (a persona's "filters" from personas.json)
+    restricts the search to chunks with matching metadata.
+    """
+    collection = get_collection()
+    index = get_bm25_index()
+    where = build_where(filters)
+    # Over-fetch so MMR can skip near-duplicate neighbours
+    pool = max(k, MMR_CANDIDATES) if MMR_ENABLED else k
+
+    lexical = [[] for _ in queries]
+    ranked_ids = [None] * len(queries) # Best-first candidate IDs per query, once known
+    if index is not None:
+        with stage("retrieval.lexical", queries=len(queries)):
+            n_lexical = max(pool, HYBRID_CANDIDATES)
+            if where is not None and index.metadatas is None:
+                lexical = _allowed(collection, [index.search(query, n_lexical) for query in queries], where)
+            else:
+                # Filtered in-process against the metadata kept with the index
+                lexical = [index.search(query, n_lexical, where) for query in queries]
+            shortcuts = 0
+            for i, query in enumerate(queries):
+                if is_conclusive(index, query, lexical[i]):
+                    # An exact-term match: no need to embed the query
+                    ranked_ids[i] = [chunk_id for chunk_id, _ in lexical[i][:pool]]
+                    shortcuts += 1
+            set_attributes(hits=sum(len(hits) for hits in lexical), shortcut=shortcuts)
+
+    by_id = {}
+    pending = [i for i, ids in enumerate(ranked_ids) if ids is None]
+    if pending:
+        # 1. Create embeddings for the queries, in one request
+        with stage("retrieval.embed", queries=len(pending)):
+            query_embeddings = embed_queries([queries[i] for i in pending])
+
+        # 2. Query the vector store for the most relevant chunks of every query
+        candidates = max(pool, HYBRID_CANDIDATES) if index is not None else pool
+        with stage("retrieval.query", n_results=candidates, queries=len(pending), filtered=where is not None):
+            results = collection.query(
+                query_embeddings=query_embeddings,
+                n_results=candidates,
+                where=where,
+                include=_include()
+            )
+            set_attributes(chunks=sum(len(documents) for documents in results['documents']))
+
+        # 3. Fuse the two rankings
+        with stage("retrieval.fuse"):
+            for row, i in enumerate(pending):
+                embeddings = results['embeddings'][row] if results.get('embeddings') is not None else None
+                vector = _chunks(results['ids'][row], results['documents'][row], results['metadatas'][row], embeddings)
+                by_id.update((chunk["id"], chunk) for chunk in vector)
+                vector_ids = [chunk["id"] for chunk in vector]
+                ranked_ids[i] = (
+                    reciprocal_rank_fusion([vector_ids, [chunk_id for chunk_id, _ in lexical[i]]], k=RRF_K)[:pool]
+                    if lexical[i] else vector_ids[:pool]
+                )
+
+    # BM25-only candidates, fetched for every query together
+    missing = list(dict.fromkeys(chunk_id for ids in ranked_ids for chunk_id in ids if chunk_id not in by_id))
+    by_id.update((chunk["id"], chunk) for chunk in _get_chunks(collection, missing))
+    return [diversify([by_id[chunk_id] for chunk_id in ids if chunk_id in by_id], k) for ids in ranked_ids]
+
+def search(query, n_results=3, filters=None):
+    """The n_results most relevant chunks for one query; see retrieve_many."""
+    return retrieve_many([query], k=n_results, filters=filters)[0]
+
+def warm_up():
+    """Opens the collection and runs one query so the index is loaded before the first mention."""
+    with stage("retrieval.warm_up"):
+        get_bm25_index()
+        retrieve_from_knowledge_base("warm up")
 
 # --- The Updated RAG Function ---
-def retrieve_from_knowledge_base(query: str) -> str:
+def retrieve_from_knowledge_base(query: str, filters=None) -> str:
     """
-    Searches the ChromaDB vector store for relevant context.
+    Searches the knowledge base (ChromaDB vectors plus the BM25 index) for relevant context.
     """
-    print(f"Searching knowledge base for: {query}")
-    
-    # 1. Create an embedding for the user's query
-    query_embedding = openai.embeddings.create(
-        input=query,
-        model="text-embedding-3-small"
-    ).data[0].embedding
-    
-    # 2. Query ChromaDB for the 3 most relevant chunks
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=3
-    )
-    
-    # 3. Format the results into a context string
-    context = "Context from Notion:\n"
-    for doc, meta in zip(results['documents'][0], results['metadatas'][0]):
-        context += f"- Source: {meta['title']} ({meta['source_url']})\n"
-        context += f"  Content: {doc}\n\n"
-        
-    return context
+    log.debug("Searching knowledge base for: %s (filters: %s)", query, filters)
+
+    # Format the results into a context string (adjacent chunks merged, one source line per page)
+    return format_context(search(query, filters=filters))
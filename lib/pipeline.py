@@ -0,0 +1,155 @@
+"""
+Staged pipelines of worker threads connected by bounded queues
+Each stage's workers take items from its queue and put what they produce on the next
+stage's, so a slow stage holds the earlier ones back instead of letting work pile up,
+and network waits in different stages overlap.
+"""
+
+import queue
+import threading
+import time
+
+_DONE = object() # Sent to each worker of a stage once its input has ended
+
+
+class _Aborted(Exception):
+    pass
+
+class Stage:
+    """
+    One step of a Pipeline: func(item) returns or yields any number of outputs (None for none),
+    run by `workers` threads. `finish()`, if given, produces the remaining outputs once the
+    input has ended; it is for stages that buffer, so they must have one worker.
+    """
+
+    def __init__(self, name, func, workers=1, finish=None):
+        if finish is not None and workers != 1:
+            raise ValueError(f"Stage {name!r} has a finish() and so needs exactly one worker")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.finish = finish
+        self.items = 0
+        self.outputs = 0
+        self.waiting = 0.0 # Worker-seconds spent waiting for input
+        self.blocked = 0.0 # Worker-seconds spent waiting for room in the next stage's queue
+        self._running = workers
+        self._lock = threading.Lock()
+
+    def report(self, elapsed):
+        return (
+            f"{self.name:<8}{self.items:>7} in{self.outputs:>7} out {self.items / max(elapsed, 1e-9):>8.1f}/s "
+            f"x{self.workers:<3} waited for input {self.waiting:>6.1f}s, blocked on output {self.blocked:>6.1f}s"
+        )
+
+class Pipeline:
+    """Feeds an iterable through `stages`, holding at most `queue_size` items between any two."""
+
+    def __init__(self, stages, queue_size=16):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.source = Stage("source", None)
+        self.elapsed = 0.0
+        self._failed = threading.Event()
+        self._error = None
+
+    def _fail(self, error):
+        if not self._failed.is_set():
+            self._error = error
+            self._failed.set()
+
+    def _get(self, inbox, stage):
+        began = time.perf_counter()
+        while True:
+            if self._failed.is_set(): # Stop taking work as soon as any stage fails, even with items queued
+                raise _Aborted()
+            try:
+                item = inbox.get(timeout=0.1)
+                break
+            except queue.Empty:
+                pass
+        with stage._lock:
+            stage.waiting += time.perf_counter() - began
+        return item
+
+    def _put(self, outbox, item, stage):
+        with stage._lock:
+            stage.outputs += item is not _DONE
+        if outbox is None: # The last stage's outputs are dropped
+            return
+        began = time.perf_counter()
+        while True:
+            if self._failed.is_set():
+                raise _Aborted()
+            try:
+                outbox.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        with stage._lock:
+            stage.blocked += time.perf_counter() - began
+
+    def _end(self, stage, outbox, next_stage):
+        """Called as each worker of `stage` stops; the last one flushes the stage and signals the next."""
+        with stage._lock:
+            stage._running -= 1
+            last = stage._running == 0
+        if last:
+            for output in (stage.finish() if stage.finish else None) or ():
+                self._put(outbox, output, stage)
+            for _ in range(next_stage.workers if next_stage else 0):
+                self._put(outbox, _DONE, stage)
+
+    def _feed(self, items, outbox, next_stage):
+        try:
+            for item in items:
+                self.source.items += 1
+                self._put(outbox, item, self.source)
+            self._end(self.source, outbox, next_stage)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def _work(self, stage, inbox, outbox, next_stage):
+        try:
+            while True:
+                item = self._get(inbox, stage)
+                if item is _DONE:
+                    break
+                with stage._lock:
+                    stage.items += 1
+                for output in stage.func(item) or ():
+                    self._put(outbox, output, stage)
+            self._end(stage, outbox, next_stage)
+        except _Aborted:
+            pass
+        except BaseException as e:
+            self._fail(e)
+
+    def run(self, items):
+        """Runs every item through the stages; re-raises the first error any stage hit."""
+        began = time.perf_counter()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages] + [None]
+        following = self.stages[1:] + [None]
+        threads = [threading.Thread(target=self._feed, args=(items, queues[0], self.stages[0]), daemon=True)]
+        for stage, inbox, outbox, next_stage in zip(self.stages, queues, queues[1:], following):
+            threads.extend(
+                threading.Thread(target=self._work, args=(stage, inbox, outbox, next_stage), name=f"{stage.name}-{i}", daemon=True)
+                for i in range(stage.workers)
+            )
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except BaseException as e: # e.g. Ctrl-C: stop the workers too
+            self._fail(e)
+            raise
+        finally:
+            self.elapsed = time.perf_counter() - began
+        if self._error is not None:
+            raise self._error
+
+    def report(self):
+        return "\n".join(stage.report(self.elapsed) for stage in [self.source, *self.stages])
@@ -0,0 +1,173 @@
+"""
+Token-budgeted prompt assembly for the Slack bot
+Counts tokens with a local `tokenizers` tokenizer, trims the lowest-ranked RAG chunks
+and the oldest history to fit each section's budget, and reports tokens per section
+"""
+
+import logging
+import threading
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from settings import (
+    PROMPT_CONTEXT_TOKENS, PROMPT_HISTORY_TOKENS, PROMPT_QUERY_TOKENS,
+    TOKENIZER_DOWNLOAD_TIMEOUT, TOKENIZER_NAME, TOKENIZER_PATH
+)
+
+USER_TEMPLATE = """
+        Here is the recent conversation history:
+        ---
+        {history}
+        ---
+
+        Here is some internal knowledge that might be relevant:
+        ---
+        {context}
+        ---
+
+        Based on all of this, please answer my latest question: "{query}"
+        """
+
+log = logging.getLogger(__name__)
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+class _ApproximateTokenizer:
+    """Fallback when no tokenizer can be loaded: roughly 4 characters per token."""
+
+    class _Encoding:
+        def __init__(self, text):
+            self.offsets = [(i, min(i + 4, len(text))) for i in range(0, len(text), 4)]
+            self.ids = list(range(len(self.offsets)))
+
+    def encode(self, text, add_special_tokens=False):
+        return self._Encoding(text)
+
+    def encode_batch(self, texts, add_special_tokens=False):
+        return [self._Encoding(text) for text in texts]
+
+
+def _load_tokenizer():
+    """
+    TOKENIZER_PATH if it exists, else TOKENIZER_NAME from the Hugging Face cache, else one
+    download of TOKENIZER_NAME (saved to TOKENIZER_PATH). The download is a single attempt
+    with a short timeout, so an offline host falls back straight away instead of retrying.
+    """
+    from tokenizers import Tokenizer
+    if TOKENIZER_PATH and os.path.exists(TOKENIZER_PATH):
+        return Tokenizer.from_file(TOKENIZER_PATH)
+
+    from huggingface_hub import constants, hf_hub_download, hf_hub_url
+    try:
+        return Tokenizer.from_file(hf_hub_download(TOKENIZER_NAME, "tokenizer.json", local_files_only=True))
+    except Exception:
+        if constants.HF_HUB_OFFLINE:
+            raise
+
+    import httpx
+    response = httpx.get(hf_hub_url(TOKENIZER_NAME, "tokenizer.json"), timeout=TOKENIZER_DOWNLOAD_TIMEOUT, follow_redirects=True)
+    response.raise_for_status()
+    tokenizer = Tokenizer.from_str(response.text)
+    if TOKENIZER_PATH:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(TOKENIZER_PATH)), exist_ok=True)
+            with open(TOKENIZER_PATH, "w", encoding="utf-8") as f:
+                f.write(response.text)
+        except OSError as e:
+            log.warning(f"Could not save the tokenizer to {TOKENIZER_PATH}: {e}")
+    return tokenizer
+
+def get_tokenizer():
+    """
+    Loads the tokenizer once (see _load_tokenizer), falling back to an approximate count.
+    Call it at startup: the prompt builder, chunker and sync batcher all wait on the first load.
+    """
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                try:
+                    _tokenizer = _load_tokenizer()
+                except Exception as e:
+                    log.warning(f"Could not load tokenizer ({e}), falling back to an approximate token count")
+                    _tokenizer = _ApproximateTokenizer()
+    return _tokenizer
+
+def count_tokens(text):
+    return len(get_tokenizer().encode(text, add_special_tokens=False).ids)
+
+def _truncate(text, encoding, max_tokens, keep_end=False):
+    """Cuts text to max_tokens using the encoding's character offsets."""
+    if max_tokens <= 0:
+        return ""
+    if len(encoding.ids) <= max_tokens:
+        return text
+    if keep_end:
+        return text[encoding.offsets[-max_tokens][0]:]
+    return text[:encoding.offsets[max_tokens - 1][1]]
+
+def fit_chunks(chunks, budget):
+    """Keeps the highest-ranked chunks that fit the budget; truncates the top chunk if it alone is too big."""
+    encodings = get_tokenizer().encode_batch(chunks, add_special_tokens=False) if chunks else []
+    kept, used = [], 0
+    for chunk, encoding in zip(chunks, encodings):
+        tokens = len(encoding.ids)
+        if used + tokens > budget:
+            if not kept:
+                kept.append(_truncate(chunk, encoding, budget))
+                used = budget
+            break
+        kept.append(chunk)
+        used += tokens
+    return kept, used
+
+def fit_history(messages, budget):
+    """Keeps the newest messages that fit the budget; the oldest are dropped first."""
+    encodings = get_tokenizer().encode_batch(messages, add_special_tokens=False) if messages else []
+    kept, used = [], 0
+    for message, encoding in zip(reversed(messages), reversed(encodings)):
+        tokens = len(encoding.ids)
+        if used + tokens > budget:
+            if not kept:
+                kept.append(_truncate(message, encoding, budget, keep_end=True))
+                used = budget
+            break
+        kept.append(message)
+        used += tokens
+    return list(reversed(kept)), used
+
+def build_prompt(system_prompt, history, context_chunks, query,
+                 history_budget=PROMPT_HISTORY_TOKENS, context_budget=PROMPT_CONTEXT_TOKENS,
+                 query_budget=PROMPT_QUERY_TOKENS):
+    """
+    Assembles the chat messages within the per-section token budgets.
+    `context_chunks` must be ordered best-first. Returns (messages, token_report).
+    """
+    kept_history, history_tokens = fit_history(list(history), history_budget)
+    kept_chunks, context_tokens = fit_chunks(list(context_chunks), context_budget)
+
+    query_encoding = get_tokenizer().encode(query, add_special_tokens=False)
+    query = _truncate(query, query_encoding, query_budget)
+
+    user_content = USER_TEMPLATE.format(
+        history="\n".join(kept_history),
+        context="\n\n".join(kept_chunks),
+        query=query
+    )
+    report = {
+        "system": count_tokens(system_prompt),
+        "history": history_tokens,
+        "context": context_tokens,
+        "query": min(len(query_encoding.ids), query_budget),
+        "template": count_tokens(USER_TEMPLATE.format(history="", context="", query="")),
+        "dropped_history": len(history) - len(kept_history),
+        "dropped_chunks": len(context_chunks) - len(kept_chunks),
+    }
+    report["total"] = report["system"] + report["history"] + report["context"] + report["query"] + report["template"]
+
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content},
+    ]
+    return messages, report
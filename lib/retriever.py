@@ -0,0 +1,152 @@
+"""
+Pluggable knowledge base retrieval for the Slack bot
+RETRIEVER_BACKEND picks the backend: "chroma" (lib/notion_rag.py in-process), "socket"
+(a shared retriever process on a unix socket) or "placeholder" (canned context).
+Run this file to start the shared retriever process:
+
+    python lib/retriever.py
+"""
+
+import json
+import logging
+import socket
+import socketserver
+import threading
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from settings import RETRIEVER_BACKEND, RETRIEVER_SOCKET_PATH
+
+log = logging.getLogger(__name__)
+
+
+class PlaceholderRetriever:
+    """Canned context, for running the bot without a synced knowledge base."""
+
+    def retrieve(self, query, filters=None):
+        log.debug("Searching knowledge base for: %s", query)
+        if "hiring" in query.lower():
+            return "Context: The Q4 hiring plan prioritizes two senior backend engineers and one product marketing manager. Budget has been approved."
+        return "Context: No specific information found on that topic."
+
+    def retrieve_many(self, queries, k=3, filters=None):
+        return [[] for _ in queries]
+
+    def warm_up(self):
+        pass
+
+
+class ChromaRetriever:
+    """Searches the local ChromaDB collection written by sync_notion.py; opened on first use."""
+
+    def retrieve(self, query, filters=None):
+        from lib import notion_rag
+        return notion_rag.retrieve_from_knowledge_base(query, filters=filters)
+
+    def retrieve_many(self, queries, k=3, filters=None):
+        """Structured chunks for several queries, with one embeddings request and one vector query."""
+        from lib import notion_rag
+        return notion_rag.retrieve_many(queries, k=k, filters=filters)
+
+    def warm_up(self):
+        from lib import notion_rag
+        notion_rag.warm_up()
+
+
+class SocketRetriever:
+    """Client for a retriever process started with `python lib/retriever.py`."""
+
+    def __init__(self, path=RETRIEVER_SOCKET_PATH, timeout=30):
+        self.path = path
+        self.timeout = timeout
+
+    def _call(self, method, **params):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            with sock.makefile("rwb") as stream:
+                stream.write(json.dumps({"method": method, **params}).encode("utf-8") + b"\n")
+                stream.flush()
+                response = json.loads(stream.readline() or b"{}")
+        if "error" in response:
+            raise RuntimeError(f"Retriever process error: {response['error']}")
+        if "result" not in response:
+            raise RuntimeError(f"Retriever process at {self.path} closed the connection")
+        return response["result"]
+
+    def retrieve(self, query, filters=None):
+        return self._call("retrieve", query=query, filters=filters)
+
+    def retrieve_many(self, queries, k=3, filters=None):
+        return self._call("retrieve_many", queries=list(queries), k=k, filters=filters)
+
+    def warm_up(self):
+        self._call("ping")
+
+
+BACKENDS = {
+    "placeholder": PlaceholderRetriever,
+    "chroma": ChromaRetriever,
+    "socket": SocketRetriever,
+}
+_retrievers = {}
+_retrievers_lock = threading.Lock()
+
+def get_retriever(backend=RETRIEVER_BACKEND):
+    """Returns the shared retriever for a backend name."""
+    with _retrievers_lock:
+        if backend not in _retrievers:
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown RETRIEVER_BACKEND {backend!r}, expected one of {', '.join(BACKENDS)}")
+            _retrievers[backend] = BACKENDS[backend]()
+        return _retrievers[backend]
+
+
+# --- Retriever process ---
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Answers newline-delimited JSON requests until the client disconnects."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                method = request.pop("method")
+                if method == "ping":
+                    result = "pong"
+                elif method == "retrieve":
+                    result = self.server.retriever.retrieve(**request)
+                elif method == "retrieve_many":
+                    result = self.server.retriever.retrieve_many(**request)
+                else:
+                    raise ValueError(f"Unknown method {method!r}")
+                response = {"result": result}
+            except Exception as e:
+                log.exception("Retrieval request failed")
+                response = {"error": str(e)}
+            self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+class RetrieverServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, retriever):
+        if os.path.exists(path):
+            os.remove(path) # Stale socket from a previous run
+        self.retriever = retriever
+        super().__init__(path, _RequestHandler)
+
+
+if __name__ == "__main__":
+    from lib.telemetry import setup_telemetry
+    setup_telemetry()
+    retriever = ChromaRetriever()
+    print("Loading the knowledge base...")
+    retriever.warm_up()
+    server = RetrieverServer(RETRIEVER_SOCKET_PATH, retriever)
+    print(f"Retriever listening on {RETRIEVER_SOCKET_PATH}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(RETRIEVER_SOCKET_PATH)
@@ -0,0 +1,42 @@
+"""
+Retries with exponential backoff for rate-limited or flaky API calls
+Retries rate limits (429), server errors (5xx), timeouts and dropped connections,
+honouring Retry-After when the response has one
+"""
+
+import logging
+import random
+import time
+import openai
+
+log = logging.getLogger(__name__)
+
+
+def is_retryable(error):
+    """True for OpenAI errors worth retrying: 429, 5xx, timeouts and connection failures."""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)): # APITimeoutError is an APIConnectionError
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def retry_after(error):
+    """Seconds from the error response's Retry-After header, if it has one."""
+    try:
+        headers = error.headers if hasattr(error, "headers") else error.response.headers # notion_client errors carry .headers
+        return float(headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+def call_with_retry(func, *args, retries=5, base_delay=1.0, max_delay=60.0, retryable=is_retryable, **kwargs):
+    """
+    Calls func(*args, **kwargs), retrying retryable errors up to `retries` times with jittered
+    exponential backoff (or Retry-After), waiting at most `max_delay` seconds between attempts.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries or not retryable(e):
+                raise
+            delay = min(max_delay, retry_after(e) or base_delay * 2 ** attempt * random.uniform(0.5, 1.0))
+            log.warning("%s: %s (attempt %d of %d), retrying in %.1fs", type(e).__name__, e, attempt + 1, retries + 1, delay)
+            time.sleep(delay)
@@ -0,0 +1,200 @@
+"""
+Fair scheduling for Slack mentions
+A fixed pool of workers drains round-robin queues (per channel, then per persona),
+a semaphore caps concurrent completions, and new work is refused past a queue depth
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+log = logging.getLogger(__name__)
+
+
+class FairQueue:
+    """Round-robin over nested FIFO queues, e.g. keys=(channel, persona). Not thread safe."""
+
+    def __init__(self):
+        self._children = OrderedDict() # key -> FairQueue or deque
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def push(self, keys, item):
+        key, rest = keys[0], tuple(keys[1:])
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = FairQueue() if rest else deque()
+        if rest:
+            child.push(rest, item)
+        else:
+            child.append(item)
+        self._size += 1
+
+    def pop(self):
+        """Pops from the key whose turn it is, then moves that key to the back of the rotation."""
+        key, child = next(iter(self._children.items()))
+        item = child.pop() if isinstance(child, FairQueue) else child.popleft()
+        if len(child):
+            self._children.move_to_end(key)
+        else:
+            del self._children[key]
+        self._size -= 1
+        return item
+
+    def depth_by_key(self):
+        return {key: len(child) for key, child in self._children.items()}
+
+
+class _SchedulerBase:
+    def __init__(self, workers, max_queue_depth, wait_samples=1000):
+        self.workers = workers
+        self.max_queue_depth = max_queue_depth
+        self._queue = FairQueue()
+        self._wait_times = deque(maxlen=wait_samples) # seconds spent queued, most recent jobs
+        self.in_flight = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        # Guards the queue and counters against stats() from other threads (e.g. metric gauges
+        # reading the async scheduler while the event loop changes them); held only briefly
+        self._state_lock = threading.Lock()
+
+    def _admit(self, keys, fn, args):
+        """Queues a job unless the backlog is full. Returns False if it was rejected."""
+        with self._state_lock:
+            if len(self._queue) >= self.max_queue_depth:
+                self.rejected += 1
+                return False
+            self._queue.push(keys, (time.monotonic(), fn, args))
+            self.submitted += 1
+            return True
+
+    def _take(self):
+        with self._state_lock:
+            queued_at, fn, args = self._queue.pop()
+            self._wait_times.append(time.monotonic() - queued_at)
+            self.in_flight += 1
+            return fn, args
+
+    def _done(self, ok):
+        with self._state_lock:
+            self.in_flight -= 1
+            if ok:
+                self.completed += 1
+            else:
+                self.failed += 1
+
+    def stats(self):
+        """Queue depth and wait-time metrics; safe to call from any thread."""
+        with self._state_lock:
+            return self._stats()
+
+    def _stats(self):
+        waits = sorted(self._wait_times)
+
+        def percentile(q):
+            return waits[min(len(waits) - 1, int(q * len(waits)))] if waits else 0.0
+
+        return {
+            "queue_depth": len(self._queue),
+            "queue_depth_by_channel": self._queue.depth_by_key(),
+            "in_flight": self.in_flight,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "wait_p50": percentile(0.50),
+            "wait_p95": percentile(0.95),
+            "wait_max": waits[-1] if waits else 0.0,
+        }
+
+
+class MentionScheduler(_SchedulerBase):
+    """Thread-based scheduler for the sync Bolt app."""
+
+    def __init__(self, workers=8, max_queue_depth=50, max_concurrent_completions=4):
+        super().__init__(workers, max_queue_depth)
+        self._condition = threading.Condition()
+        self._completion_slots = threading.BoundedSemaphore(max_concurrent_completions)
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"mention-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, keys, fn, *args):
+        with self._condition:
+            admitted = self._admit(keys, fn, args)
+            if admitted:
+                self._condition.notify()
+            return admitted
+
+    def completion_slot(self):
+        """Context manager held for the duration of one OpenAI completion."""
+        return self._completion_slots
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not len(self._queue):
+                    self._condition.wait()
+                fn, args = self._take()
+            ok = True
+            try:
+                fn(*args)
+            except Exception:
+                ok = False
+                log.exception("Scheduled mention failed")
+            with self._condition:
+                self._done(ok)
+
+
+class AsyncMentionScheduler(_SchedulerBase):
+    """asyncio scheduler for the AsyncApp; workers are tasks on the running loop."""
+
+    def __init__(self, workers=8, max_queue_depth=50, max_concurrent_completions=4):
+        super().__init__(workers, max_queue_depth)
+        self._max_concurrent_completions = max_concurrent_completions
+        self._wakeup = None
+        self._completion_slots = None
+        self._tasks = []
+
+    def _start(self):
+        # Created lazily so they bind to the loop the app is running on
+        self._wakeup = asyncio.Event()
+        self._completion_slots = asyncio.Semaphore(self._max_concurrent_completions)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, keys, fn, *args):
+        if not self._tasks:
+            self._start()
+        admitted = self._admit(keys, fn, args)
+        if admitted:
+            self._wakeup.set()
+        return admitted
+
+    def completion_slot(self):
+        """Async context manager held for the duration of one OpenAI completion."""
+        if self._completion_slots is None:
+            self._start()
+        return self._completion_slots
+
+    async def _worker(self):
+        while True:
+            while not len(self._queue):
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            fn, args = self._take()
+            ok = True
+            try:
+                await fn(*args)
+            except Exception:
+                ok = False
+                log.exception("Scheduled mention failed")
+            self._done(ok)
@@ -0,0 +1,126 @@
+"""
+Streaming helpers for the Slack bot
+Coalesces streamed completion tokens into throttled chat_update calls
+"""
+
+import asyncio
+import time
+
+# Slack rejects an empty edit (no_text), which would leave "Thinking..." in place
+EMPTY_ANSWER_TEXT = "Sorry, I don't have an answer for that."
+
+
+class _StreamBuffer:
+    """Accumulates streamed text and decides when the next edit is due."""
+
+    def __init__(self, channel, ts, updates_per_second):
+        self.channel = channel
+        self.ts = ts
+        self.interval = 1.0 / updates_per_second if updates_per_second > 0 else 0.0
+        self.text = ""
+        self._sent_text = ""
+        self._last_sent = float("-inf")
+        self._finished = False
+        self.posted = False
+
+    def _add(self, delta):
+        """Appends a delta and returns True if an intermediate edit should be sent now."""
+        if self._finished:
+            raise RuntimeError("Cannot append to a finished stream")
+        self.text += delta
+        if not self.text.strip() or self.text == self._sent_text:
+            return False
+        return time.monotonic() - self._last_sent >= self.interval
+
+    def _mark_sent(self, delivered=True):
+        # A failed edit still counts against the rate limit but didn't change the message
+        if delivered:
+            self._sent_text = self.text
+        self._last_sent = time.monotonic()
+
+    def _finish(self, text):
+        """Returns True exactly once, the first time the stream is finished and still needs its final edit."""
+        if self._finished:
+            return False
+        self._finished = True
+        if text is not None:
+            self.text = text
+        if not self.text.strip():
+            self.text = EMPTY_ANSWER_TEXT
+        if self.text == self._sent_text:
+            # The last intermediate edit already carried the full text
+            self.posted = True
+            return False
+        return True
+
+    def _wait_time(self):
+        """Seconds until the next edit respects the minimum interval."""
+        return max(0.0, self._last_sent + self.interval - time.monotonic())
+
+
+class MessageStreamer(_StreamBuffer):
+    """Edits a posted Slack message in place as completion text arrives (sync WebClient)."""
+
+    def __init__(self, client, channel, ts, updates_per_second, logger=None):
+        super().__init__(channel, ts, updates_per_second)
+        self.client = client
+        self.logger = logger
+
+    def append(self, delta):
+        if self._add(delta):
+            try:
+                self.client.chat_update(channel=self.channel, ts=self.ts, text=self.text)
+            except Exception as e:
+                # A dropped intermediate edit is harmless, the final edit carries the full text
+                if self.logger:
+                    self.logger.warning(f"Skipped streaming update: {e}")
+                self._mark_sent(delivered=False)
+                return
+            self._mark_sent()
+
+    def finish(self, text=None):
+        """Sends the final edit (exactly once) and returns the full text; `posted` tells whether it landed."""
+        if self._finish(text):
+            time.sleep(self._wait_time())
+            try:
+                self.client.chat_update(channel=self.channel, ts=self.ts, text=self.text)
+                self.posted = True
+            except Exception as e:
+                # Leave posted False so the caller edits the message itself
+                if self.logger:
+                    self.logger.warning(f"Final streaming update failed: {e}")
+            self._mark_sent(delivered=self.posted)
+        return self.text
+
+
+class AsyncMessageStreamer(_StreamBuffer):
+    """Async variant of MessageStreamer for the AsyncWebClient."""
+
+    def __init__(self, client, channel, ts, updates_per_second, logger=None):
+        super().__init__(channel, ts, updates_per_second)
+        self.client = client
+        self.logger = logger
+
+    async def append(self, delta):
+        if self._add(delta):
+            try:
+                await self.client.chat_update(channel=self.channel, ts=self.ts, text=self.text)
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"Skipped streaming update: {e}")
+                self._mark_sent(delivered=False)
+                return
+            self._mark_sent()
+
+    async def finish(self, text=None):
+        """Sends the final edit (exactly once) and returns the full text; `posted` tells whether it landed."""
+        if self._finish(text):
+            await asyncio.sleep(self._wait_time())
+            try:
+                await self.client.chat_update(channel=self.channel, ts=self.ts, text=self.text)
+                self.posted = True
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"Final streaming update failed: {e}")
+            self._mark_sent(delivered=self.posted)
+        return self.text
@@ -0,0 +1,51 @@
+"""
+Local manifest of what sync_notion.py last wrote to the vector store
+Records each page's last_edited_time and a content hash per chunk, so a sync can skip
+unchanged pages, re-embed only changed chunks and delete chunks that no longer exist
+"""
+
+import hashlib
+import json
+import os
+
+
+def chunk_hash(document, metadata):
+    """Identifies a chunk's stored content: its text and the metadata written with it."""
+    return hashlib.sha256(json.dumps([document, metadata], sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+class SyncManifest:
+    """
+    page ID -> {"last_edited_time", "chunks": [chunk hash, ...]}, valid for one store
+    and embedding provider (`fingerprint`); a manifest for anything else starts empty.
+    """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.pages = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            if data.get("fingerprint") == fingerprint:
+                self.pages = data["pages"]
+
+    def is_unchanged(self, page_id, last_edited_time):
+        page = self.pages.get(page_id)
+        return page is not None and page["last_edited_time"] == last_edited_time
+
+    def chunk_hashes(self, page_id):
+        return self.pages.get(page_id, {}).get("chunks", [])
+
+    def update(self, page_id, last_edited_time, hashes):
+        self.pages[page_id] = {"last_edited_time": last_edited_time, "chunks": hashes}
+
+    def remove(self, page_id):
+        """Forgets a page; returns the chunk hashes it had."""
+        return self.pages.pop(page_id, {}).get("chunks", [])
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"fingerprint": self.fingerprint, "pages": self.pages}, file)
+        os.replace(tmp_path, self.path)
@@ -1,20 +1,34 @@
-import chromadb
 from notion_client import Client
-import openai
+import argparse
 import sys
 import os
+import textwrap
+import time
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from settings import CHROMA_COLLECTION_NAME, CHROMA_DB_PATH, NOTION_API_TOKEN, NOTION_DATABASE_ID, OPENAI_API_KEY
+from settings import (
+    BM25_INDEX_PATH, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS, NOTION_API_TOKEN, NOTION_DATABASE_ID, NOTION_FETCH_WORKERS,
+    SYNC_MANIFEST_PATH, SYNC_MARKER_PATH, SYNC_EMBEDDING_BATCH_SIZE, SYNC_EMBEDDING_BATCH_TOKENS, SYNC_EMBEDDING_WORKERS, SYNC_QUEUE_SIZE,
+    SYNC_UPSERT_BATCH_SIZE, VECTOR_STORE_BACKEND
+)
+from lib.bm25 import BM25Index
+from lib.chunker import CHUNK_METADATA, chunk_page
+from lib.embeddings import embed_documents, get_document_store, get_embedding_provider
+from lib.metadata_filters import page_metadata
+from lib.notion_fetch import NotionFetcher
+from lib.pipeline import Pipeline, Stage
+from lib.prompt_builder import count_tokens, get_tokenizer
+from lib.sync_manifest import SyncManifest, chunk_hash
+from lib.vector_store import open_vector_store
 
 
-notion = Client(auth=NOTION_API_TOKEN)
-openai.api_key = OPENAI_API_KEY
-chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH) # This will save the DB to a local folder
-collection = chroma_client.get_or_create_collection(name=CHROMA_COLLECTION_NAME)
-
 # --- FUNCTIONS ---
+# Block types whose children are indented under them (other containers, e.g. columns, aren't)
+NESTING_BLOCKS = {'bulleted_list_item', 'numbered_list_item', 'to_do', 'toggle'}
+# Tokens kept free for the heading path prefixed to each chunk
+CHUNK_PREFIX_TOKENS = 32
+
 def get_text_from_blocks(blocks):
-    """Extracts plain text from a list of Notion block objects."""
+    """Extracts plain text from a list of Notion block objects, including their nested "children"."""
     text = []
     for block in blocks:
         block_type = block.get('type', '')
@@ -66,45 +80,265 @@ def get_text_from_blocks(blocks):
             rich_text = block.get('quote', {}).get('rich_text', [])
             if rich_text:
                 text.append(f"> {rich_text[0].get('plain_text', '')}")
+        
+        elif block_type == 'toggle':
+            rich_text = block.get('toggle', {}).get('rich_text', [])
+            if rich_text:
+                text.append(f"▸ {rich_text[0].get('plain_text', '')}")
+        
+        elif block_type == 'callout':
+            rich_text = block.get('callout', {}).get('rich_text', [])
+            if rich_text:
+                text.append(rich_text[0].get('plain_text', ''))
+        
+        children_text = get_text_from_blocks(block.get('children', []))
+        if children_text:
+            text.append(textwrap.indent(children_text, "  ") if block_type in NESTING_BLOCKS else children_text)
     
     return "\n".join(text)
 
-def chunk_text(text, chunk_size=1000):
-    """Simple function to break text into smaller chunks."""
-    return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
+def chunk_token_budget(provider=None, max_tokens=CHUNK_MAX_TOKENS):
+    """
+    `max_tokens`, lowered if chunks that size would not fit the embedding provider's input with
+    their heading path prefix (e.g. ONNX_EMBEDDING_MAX_LENGTH), since the provider would cut them short.
+    Chunks are counted with the prompt tokenizer, which may differ from the provider's, so the
+    ONNX provider still warns about any text it truncates.
+    """
+    limit = getattr(provider or get_embedding_provider(), "max_input_tokens", None)
+    if limit is None or max_tokens + CHUNK_PREFIX_TOKENS <= limit:
+        return max_tokens
+    budget = max(1, limit - CHUNK_PREFIX_TOKENS)
+    print(f"CHUNK_MAX_TOKENS={max_tokens} plus the heading prefix exceeds the embedding model's {limit} token input, using {budget}")
+    return budget
 
-# --- MAIN SYNC LOGIC ---
-if __name__ == "__main__":
-    print("Starting Notion sync...")
-    db_pages = notion.databases.query(database_id=NOTION_DATABASE_ID).get("results")
-    
-    for page in db_pages:
+class EmbeddingBatcher:
+    """
+    Groups chunks from any number of pages into embeddings requests of up to `batch_tokens`
+    tokens and `batch_size` chunks. Full batches collect in `ready`; flush() closes the last one.
+    """
+
+    def __init__(self, batch_tokens=SYNC_EMBEDDING_BATCH_TOKENS, batch_size=SYNC_EMBEDDING_BATCH_SIZE):
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.ready = []
+        self._batch = [] # (ID, document, metadata) not yet in a full batch
+        self._batch_token_count = 0
+        self.chunks = 0
+        self.tokens = 0
+
+    def add(self, chunk_id, document, metadata):
+        tokens = count_tokens(document)
+        if self._batch and (self._batch_token_count + tokens > self.batch_tokens or len(self._batch) >= self.batch_size):
+            self.ready.append(self._batch)
+            self._batch, self._batch_token_count = [], 0
+        self._batch.append((chunk_id, document, metadata))
+        self._batch_token_count += tokens
+        self.chunks += 1
+        self.tokens += tokens
+
+    def take_ready(self):
+        ready, self.ready = self.ready, []
+        return ready
+
+    def flush(self):
+        """Every batch not yet taken, including the partly filled one."""
+        if self._batch:
+            self.ready.append(self._batch)
+            self._batch, self._batch_token_count = [], 0
+        return self.take_ready()
+
+def embed_batch(batch):
+    """
+    Embeds a batch from EmbeddingBatcher in (at most) one request, taking what it can from the
+    embedding store; returns (ID, embedding, document, metadata) records.
+    """
+    embeddings = embed_documents([document for _, document, _ in batch])
+    return [(chunk_id, embedding, document, metadata) for (chunk_id, document, metadata), embedding in zip(batch, embeddings)]
+
+class UpsertBuffer:
+    """Writes embedded records to the vector store `upsert_size` at a time. Call flush() after the last ones."""
+
+    def __init__(self, collection, upsert_size=SYNC_UPSERT_BATCH_SIZE):
+        self.collection = collection
+        self.upsert_size = upsert_size
+        self._records = []
+
+    def add(self, records):
+        self._records.extend(records)
+        while len(self._records) >= self.upsert_size:
+            self._write(self._records[:self.upsert_size])
+            self._records = self._records[self.upsert_size:]
+
+    def _write(self, records):
+        ids, embeddings, documents, metadatas = (list(column) for column in zip(*records))
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def flush(self):
+        if self._records:
+            self._write(self._records)
+            self._records = []
+
+class ChunkIndexer:
+    """
+    Embeds and stores chunks in bulk, one step at a time in the calling thread: chunks are
+    batched by EmbeddingBatcher and written by UpsertBuffer. Call flush() after the last page.
+    (sync_notion.py runs the same steps as a concurrent pipeline, see sync_database.)
+    """
+
+    def __init__(self, collection, batch_tokens=SYNC_EMBEDDING_BATCH_TOKENS, batch_size=SYNC_EMBEDDING_BATCH_SIZE,
+                 upsert_size=SYNC_UPSERT_BATCH_SIZE):
+        self.batcher = EmbeddingBatcher(batch_tokens, batch_size)
+        self.writer = UpsertBuffer(collection, upsert_size)
+        self.batches = 0
+        self.started = time.perf_counter()
+
+    def add(self, chunk_id, document, metadata):
+        self.batcher.add(chunk_id, document, metadata)
+        for batch in self.batcher.take_ready():
+            self._embed(batch)
+
+    def _embed(self, batch):
+        self.writer.add(embed_batch(batch))
+        self.batches += 1
+
+    def flush(self):
+        """Embeds and writes everything still buffered."""
+        for batch in self.batcher.flush():
+            self._embed(batch)
+        self.writer.flush()
+
+    def report(self):
+        return throughput_report(self.batcher, self.batches, time.perf_counter() - self.started)
+
+def throughput_report(batcher, batches, elapsed):
+    elapsed = max(elapsed, 1e-9)
+    return (
+        f"Indexed {batcher.chunks} chunks ({batcher.tokens} tokens) in {batches} embedding batches in {elapsed:.1f}s: "
+        f"{batcher.chunks / elapsed:.1f} chunks/sec, {batcher.tokens / elapsed:.0f} tokens/sec"
+    )
+
+def index_page(indexer, page_id, page_text, metadata, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS, previous=()):
+    """
+    Chunks one page's text (see lib/chunker.py) and queues the chunks on a ChunkIndexer (or
+    EmbeddingBatcher), skipping those whose hash matches `previous` (the page's chunk hashes
+    from the sync manifest). Returns the chunk hashes.
+    """
+    hashes = []
+    for i, chunk in enumerate(chunk_page(page_text, metadata.get("title"), max_tokens, overlap_tokens)):
+        # Heading path and offsets in the page, for context assembly
+        chunk_metadata = {**metadata, **{key: chunk[key] for key in CHUNK_METADATA}}
+        hashes.append(chunk_hash(chunk["text"], chunk_metadata))
+        if i >= len(previous) or previous[i] != hashes[-1]:
+            indexer.add(f"{page_id}_{i}", chunk["text"], chunk_metadata)
+    return hashes
+
+def build_bm25_index(collection, path=BM25_INDEX_PATH):
+    """Rebuilds the BM25 index over every chunk in the collection, for hybrid retrieval."""
+    all_chunks = collection.get(include=["documents", "metadatas"])
+    # With each chunk's filterable metadata, so persona filters apply to BM25 hits in-process
+    BM25Index.build(all_chunks['ids'], all_chunks['documents'], all_chunks['metadatas']).save(path)
+
+def sync_database(notion, collection, manifest, database_id, full=False, max_tokens=None):
+    """
+    Streams the database's new and edited pages through fetch -> chunk -> embed -> write
+    stages, each on its own threads with bounded queues between them, so page N+1 is
+    fetched while page N's chunks are embedded and, with Chroma, memory stays flat however
+    many pages there are (the NumPy store holds everything it writes until the final flush).
+    Then deletes stale chunks. `max_tokens` defaults to chunk_token_budget().
+    Returns (chunks written, stale chunks deleted).
+    """
+    current_ids, written_ids, stale_ids = set(), set(), []
+    max_tokens = max_tokens or chunk_token_budget()
+    batcher = EmbeddingBatcher()
+    writer = UpsertBuffer(collection)
+
+    def changed_pages():
+        for page in notion.iter_database(database_id):
+            current_ids.add(page['id'])
+            if full or not manifest.is_unchanged(page['id'], page['last_edited_time']):
+                yield page
+
+    def fetch(page):
+        return [(page, notion.get_blocks(page['id']))]
+
+    def chunk(item):
+        page, blocks = item
         page_id = page['id']
         page_title = page['properties']['Name']['title'][0]['text']['content']
         page_url = page['url']
+        # Category, Department, Status etc., so personas can filter what they retrieve
+        metadata = {"source_url": page_url, "title": page_title, **page_metadata(page)}
         
         print(f"Processing page: {page_title}")
         
-        blocks = notion.blocks.children.list(block_id=page_id).get('results')
         page_text = get_text_from_blocks(blocks)
         
-        chunks = chunk_text(page_text)
-        
-        for i, chunk in enumerate(chunks):
-            # Generate embedding for the chunk
-            embedding = openai.embeddings.create(
-                input=chunk,
-                model="text-embedding-3-small"
-            ).data[0].embedding
-            
-            # Store the chunk, embedding, and metadata in ChromaDB
-            doc_id = f"{page_id}_{i}"
-            collection.add(
-                embeddings=[embedding],
-                documents=[chunk],
-                metadatas=[{"source_url": page_url, "title": page_title}],
-                ids=[doc_id]
-            )
+        previous = manifest.chunk_hashes(page_id)
+        hashes = index_page(batcher, page_id, page_text, metadata, max_tokens, previous=() if full else previous)
+        written_ids.update(f"{page_id}_{i}" for i in range(len(hashes)))
+        # The page got shorter: drop its trailing chunks
+        stale_ids.extend(f"{page_id}_{i}" for i in range(len(hashes), len(previous)))
+        manifest.update(page_id, page['last_edited_time'], hashes)
+        return batcher.take_ready()
+
+    embed = Stage("embed", lambda batch: [embed_batch(batch)], workers=SYNC_EMBEDDING_WORKERS)
+    pipeline = Pipeline([
+        Stage("fetch", fetch, workers=NOTION_FETCH_WORKERS),
+        Stage("chunk", chunk, finish=batcher.flush),
+        embed,
+        Stage("write", writer.add, finish=writer.flush),
+    ], queue_size=SYNC_QUEUE_SIZE)
+    pipeline.run(changed_pages())
+
+    # Pages deleted from the database
+    for page_id in [page_id for page_id in manifest.pages if page_id not in current_ids]:
+        stale_ids.extend(f"{page_id}_{i}" for i in range(len(manifest.remove(page_id))))
+    if full:
+        stale_ids = [chunk_id for chunk_id in collection.get(include=[])['ids'] if chunk_id not in written_ids]
+    if stale_ids:
+        collection.delete(ids=stale_ids)
+    collection.flush()
+
+    print(f"Fetched {pipeline.source.items} of {len(current_ids)} pages with {notion.requests} Notion requests, "
+          f"deleted {len(stale_ids)} stale chunks")
+    print(throughput_report(batcher, embed.items, pipeline.elapsed))
+    store = get_document_store()
+    if store is not None:
+        stats = store.stats()
+        print(f"Embedding store: {stats['hits']} chunks reused, {stats['misses']} embedded ({stats['hit_rate']:.0%} reused)")
+    print(pipeline.report())
+    return batcher.chunks, len(stale_ids)
+
+# --- MAIN SYNC LOGIC ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Syncs the Notion knowledge base into the vector store.")
+    parser.add_argument("--full", action="store_true", help="Re-read and re-embed every page, ignoring the sync manifest")
+    args = parser.parse_args()
+
+    get_tokenizer() # The chunker and embedding batcher count tokens with it; load it before the workers start
+    notion = NotionFetcher(Client(auth=NOTION_API_TOKEN))
+    # Records the embedding provider on creation so the bot never queries it with another provider's vectors
+    collection = open_vector_store(create=True)
+    max_tokens = chunk_token_budget()
+    manifest = SyncManifest(SYNC_MANIFEST_PATH, {
+        "store": f"{VECTOR_STORE_BACKEND}:{collection.name}",
+        "embedding_provider": get_embedding_provider().name,
+        "chunking": f"{max_tokens}/{CHUNK_OVERLAP_TOKENS}", # Other chunk settings re-chunk every page
+    })
+    # Without a usable manifest, check every stored chunk against what this sync writes
+    full = args.full or not manifest.pages or collection.count() == 0
+
+    print(f"Starting Notion sync ({'full' if full else 'incremental'})...")
+    written, deleted = sync_database(notion, collection, manifest, NOTION_DATABASE_ID, full, max_tokens)
+    manifest.save()
+
+    if written or deleted:
+        print("Building BM25 index...")
+        build_bm25_index(collection)
+
+        # Let running bots know the knowledge base changed (invalidates their answer caches)
+        with open(SYNC_MARKER_PATH, "w") as marker:
+            marker.write(str(time.time()))
 
     print("Notion sync complete!")
     print(f"Total documents in knowledge base: {collection.count()}")
@@ -0,0 +1,208 @@
+"""
+Tracing, stage latency metrics and logging for the Slack bot
+Wraps each stage of a request in an OpenTelemetry span and records its duration
+in a per-stage histogram (exported over OTLP and summarised locally as p50/p95/p99)
+"""
+
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from opentelemetry import metrics, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor, SpanExporter, SpanExportResult
+)
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from settings import (
+    LOG_FORMAT, LOG_LEVEL, OTEL_SERVICE_NAME, STAGE_SUMMARY_INTERVAL_SECONDS, TRACE_EXPORTER, TRACE_FILE
+)
+
+log = logging.getLogger(__name__)
+tracer = trace.get_tracer("c-suite")
+meter = metrics.get_meter("c-suite")
+stage_duration = meter.create_histogram("stage.duration", unit="ms", description="Duration of each request stage")
+
+
+# --- Local stage histograms ---
+class StageStats:
+    """Keeps the most recent durations per stage and reports percentiles."""
+
+    def __init__(self, samples=2048):
+        self._durations = defaultdict(lambda: deque(maxlen=samples))
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self._durations[stage].append(seconds)
+            self._counts[stage] += 1
+
+    def reset(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+
+    def summary(self):
+        """{stage: {"count", "p50_ms", "p95_ms", "p99_ms", "max_ms"}}"""
+        with self._lock:
+            snapshot = {stage: sorted(durations) for stage, durations in self._durations.items()}
+            counts = dict(self._counts)
+        result = {}
+        for stage, durations in sorted(snapshot.items()):
+            def percentile(q):
+                return round(durations[min(len(durations) - 1, int(q * len(durations)))] * 1000, 2)
+            result[stage] = {
+                "count": counts[stage],
+                "p50_ms": percentile(0.50),
+                "p95_ms": percentile(0.95),
+                "p99_ms": percentile(0.99),
+                "max_ms": round(durations[-1] * 1000, 2),
+            }
+        return result
+
+
+stage_stats = StageStats()
+_last_summary = time.monotonic()
+
+
+def _maybe_log_summary():
+    global _last_summary
+    if STAGE_SUMMARY_INTERVAL_SECONDS and time.monotonic() - _last_summary >= STAGE_SUMMARY_INTERVAL_SECONDS:
+        _last_summary = time.monotonic()
+        log.info("Stage latency summary: %s", json.dumps(stage_stats.summary()))
+
+@contextmanager
+def stage(name, **attributes):
+    """Traces one stage of a request and records its duration."""
+    start = time.perf_counter()
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        try:
+            yield span
+        finally:
+            elapsed = time.perf_counter() - start
+            stage_stats.record(name, elapsed)
+            stage_duration.record(elapsed * 1000, {"stage": name})
+            _maybe_log_summary()
+
+async def traced(name, awaitable, **attributes):
+    """Awaits `awaitable` inside a stage span (for use with asyncio.gather)."""
+    with stage(name, **attributes):
+        return await awaitable
+
+def set_attributes(**attributes):
+    """Adds attributes to the current span, e.g. token counts or cache hits."""
+    span = trace.get_current_span()
+    if span.is_recording():
+        span.set_attributes({key: value for key, value in attributes.items() if value is not None})
+
+def register_gauge(name, callback, description=""):
+    """Exports `callback()` as an observable gauge, e.g. queue depth."""
+    meter.create_observable_gauge(
+        name,
+        callbacks=[lambda options: [metrics.Observation(callback())]],
+        description=description
+    )
+
+
+# --- Exporters ---
+class JsonFileSpanExporter(SpanExporter):
+    """Appends finished spans to a JSON lines file for local inspection."""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        with self._lock:
+            for span in spans:
+                self._file.write(json.dumps({
+                    "name": span.name,
+                    "trace_id": format(span.context.trace_id, "032x"),
+                    "span_id": format(span.context.span_id, "016x"),
+                    "parent_id": format(span.parent.span_id, "016x") if span.parent else None,
+                    "start": span.start_time,
+                    "duration_ms": (span.end_time - span.start_time) / 1e6,
+                    "attributes": dict(span.attributes or {}),
+                    "status": span.status.status_code.name,
+                }) + "\n")
+            self._file.flush()
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        self._file.close()
+
+
+# --- Logging ---
+class _TraceContextFilter(logging.Filter):
+    """Adds the current trace/span IDs to every log record."""
+
+    def filter(self, record):
+        context = trace.get_current_span().get_span_context()
+        record.trace_id = format(context.trace_id, "032x") if context.is_valid else None
+        record.span_id = format(context.span_id, "016x") if context.is_valid else None
+        return True
+
+class JsonFormatter(logging.Formatter):
+    _reserved = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self._reserved})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+def setup_logging():
+    handler = logging.StreamHandler()
+    handler.addFilter(_TraceContextFilter())
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logging.basicConfig(level=LOG_LEVEL.upper(), handlers=[handler], force=True)
+
+def setup_tracing():
+    """Installs the tracer (and, with OTLP, meter) providers selected by TRACE_EXPORTER."""
+    exporters = [name.strip() for name in TRACE_EXPORTER.split(",") if name.strip() and name.strip() != "none"]
+    if not exporters:
+        return
+
+    resource = Resource.create({"service.name": OTEL_SERVICE_NAME})
+    provider = TracerProvider(resource=resource)
+    for name in exporters:
+        if name == "console":
+            provider.add_span_processor(SimpleSpanProcessor(ConsoleSpanExporter()))
+        elif name == "file":
+            provider.add_span_processor(BatchSpanProcessor(JsonFileSpanExporter(TRACE_FILE)))
+        elif name == "otlp":
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+            from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+            from opentelemetry.sdk.metrics import MeterProvider
+            from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            metrics.set_meter_provider(MeterProvider(
+                resource=resource,
+                metric_readers=[PeriodicExportingMetricReader(OTLPMetricExporter())]
+            ))
+        else:
+            log.warning(f"Unknown trace exporter {name!r}, ignoring it")
+    trace.set_tracer_provider(provider)
+    atexit.register(provider.shutdown)
+
+def setup_telemetry():
+    setup_logging()
+    setup_tracing()
+    atexit.register(lambda: log.info("Stage latency summary: %s", json.dumps(stage_stats.summary())))
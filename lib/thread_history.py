@@ -0,0 +1,88 @@
+"""
+Thread-aware conversation history cache for the Slack bot
+Threads are filled once from conversations.replies and then kept current from message events
+"""
+
+import threading
+from collections import OrderedDict
+
+
+class ThreadHistoryStore:
+    """LRU over (channel, thread_ts), each thread capped to its most recent messages."""
+
+    def __init__(self, max_threads=256, max_messages=50):
+        self.max_threads = max_threads
+        self.max_messages = max_messages
+        self._threads = OrderedDict() # (channel, thread_ts) -> {ts: text}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _trim(self, messages):
+        if len(messages) > self.max_messages:
+            for ts in sorted(messages, key=float)[:-self.max_messages]:
+                del messages[ts]
+
+    @staticmethod
+    def _texts(messages):
+        return [messages[ts] for ts in sorted(messages, key=float)]
+
+    def get(self, channel, thread_ts):
+        """Returns the cached message texts (oldest first), or None if the thread isn't cached."""
+        key = (channel, thread_ts)
+        with self._lock:
+            messages = self._threads.get(key)
+            if messages is None:
+                self.misses += 1
+                return None
+            self._threads.move_to_end(key)
+            self.hits += 1
+            return self._texts(messages)
+
+    def fill(self, channel, thread_ts, messages):
+        """Caches a thread from conversations.replies messages and returns its texts."""
+        key = (channel, thread_ts)
+        with self._lock:
+            cached = self._threads.setdefault(key, {})
+            self._threads.move_to_end(key)
+            for message in messages:
+                if message.get('text'):
+                    cached[message['ts']] = message['text']
+            self._trim(cached)
+            while len(self._threads) > self.max_threads:
+                self._threads.popitem(last=False)
+            return self._texts(cached)
+
+    def add_message(self, channel, thread_ts, ts, text):
+        """Adds or replaces a message in a cached thread. Uncached threads are ignored."""
+        with self._lock:
+            messages = self._threads.get((channel, thread_ts))
+            if messages is None or not text:
+                return False
+            messages[ts] = text
+            self._trim(messages)
+            return True
+
+    def remove_message(self, channel, thread_ts, ts):
+        with self._lock:
+            messages = self._threads.get((channel, thread_ts))
+            if messages is not None:
+                messages.pop(ts, None)
+
+    def record_event(self, event):
+        """Applies a Slack `message` event (new, edited or deleted message) to the cache."""
+        channel = event.get('channel')
+        subtype = event.get('subtype')
+
+        if subtype == 'message_changed':
+            message = event.get('message', {})
+            self.add_message(channel, message.get('thread_ts', message.get('ts')), message.get('ts'), message.get('text'))
+        elif subtype == 'message_deleted':
+            previous = event.get('previous_message', {})
+            self.remove_message(channel, previous.get('thread_ts', event.get('deleted_ts')), event.get('deleted_ts'))
+        elif subtype in (None, 'bot_message', 'thread_broadcast', 'file_share', 'me_message'):
+            self.add_message(channel, event.get('thread_ts', event.get('ts')), event.get('ts'), event.get('text'))
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "threads": len(self._threads)}
@@ -0,0 +1,255 @@
+"""
+Vector stores for the knowledge base
+VECTOR_STORE_BACKEND picks ChromaDB or an in-process NumPy store that keeps every
+embedding in one memory-mapped float32/float16 matrix and answers exact top-k queries.
+Both expose the subset of Chroma's collection API that sync_notion and notion_rag use.
+"""
+
+import json
+import os
+import threading
+
+import chromadb
+import numpy as np
+from chromadb.errors import NotFoundError
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from settings import CHROMA_COLLECTION_NAME, CHROMA_DB_PATH, NUMPY_STORE_DTYPE, NUMPY_STORE_PATH, VECTOR_STORE_BACKEND
+from lib.embeddings import check_collection, collection_metadata
+from lib.metadata_filters import matches_where
+
+
+class ChromaVectorStore:
+    """The ChromaDB collection written by sync_notion.py."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+
+    @property
+    def metadata(self):
+        return self.collection.metadata
+
+    def count(self):
+        return self.collection.count()
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        return self.collection.query(query_embeddings=query_embeddings, n_results=n_results, where=where, include=list(include))
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas")):
+        return self.collection.get(ids=ids, where=where, include=list(include))
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self.collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def flush(self):
+        pass # Chroma persists on every write
+
+
+class NumpyVectorStore:
+    """
+    Exact cosine top-k over a memory-mapped matrix of L2-normalised vectors, with
+    parallel ID/document/metadata lists. Writes are buffered until flush(), which
+    rewrites the files; readers pick up a new flush on their next query. The whole store,
+    including buffered writes, is held in memory while it is being written.
+    """
+
+    _BLOCK_ROWS = 8192 # Rows multiplied at a time, bounding the temporary float32 copy of float16 data
+
+    def __init__(self, path, metadata=None, dtype="float32"):
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+        self._lock = threading.Lock()
+        self._info_mtime = None
+        self._pending = {} # chunk ID -> (vector, document, metadata), or None to delete; applied on the next read or flush
+        self._dirty = False
+        if os.path.exists(self._file("info.json")):
+            self._load()
+        else:
+            self.metadata = dict(metadata or {})
+            self.dtype = np.dtype(dtype)
+            self._vectors = np.zeros((0, self.metadata.get("embedding_dimension", 0)), dtype=self.dtype)
+            self._ids, self._documents, self._metadatas = [], [], []
+            self._rows = {}
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _load(self):
+        with open(self._file("info.json"), "r", encoding="utf-8") as file:
+            info = json.load(file)
+        with open(self._file("records.json"), "r", encoding="utf-8") as file:
+            records = json.load(file)
+        self.metadata = info["metadata"]
+        self.dtype = np.dtype(info["dtype"])
+        self._vectors = np.load(self._file("vectors.npy"), mmap_mode="r")
+        self._ids, self._documents, self._metadatas = records["ids"], records["documents"], records["metadatas"]
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+        self._info_mtime = os.stat(self._file("info.json")).st_mtime_ns
+
+    def _refresh(self):
+        """Applies buffered upserts, or reloads after another process flushed (info.json is written last)."""
+        if self._dirty:
+            with self._lock:
+                self._apply_pending()
+            return
+        try:
+            mtime = os.stat(self._file("info.json")).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime != self._info_mtime:
+            with self._lock:
+                if mtime != self._info_mtime:
+                    self._load()
+
+    def count(self):
+        self._refresh()
+        return len(self._ids)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=("documents", "metadatas", "distances")):
+        """Chroma-style results for one or more query vectors; distances are cosine distances."""
+        self._refresh()
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+        queries = queries / np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None) # Not in place: asarray may return the caller's array
+
+        vectors = self._vectors
+        candidates = None
+        if where:
+            candidates = np.array([row for row, metadata in enumerate(self._metadatas) if matches_where(metadata, where)], dtype=np.int64)
+            vectors = vectors[candidates]
+
+        if len(vectors) <= self._BLOCK_ROWS:
+            scores = queries @ np.asarray(vectors, dtype=np.float32).T
+        else:
+            scores = np.concatenate([
+                queries @ np.asarray(vectors[start:start + self._BLOCK_ROWS], dtype=np.float32).T
+                for start in range(0, len(vectors), self._BLOCK_ROWS)
+            ], axis=1)
+
+        k = min(n_results, scores.shape[1])
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": [], "embeddings": []}
+        for row_scores in scores:
+            top = np.argpartition(-row_scores, k - 1)[:k] if k else np.array([], dtype=np.int64)
+            top = top[np.argsort(-row_scores[top])]
+            rows = candidates[top] if candidates is not None else top
+            results["ids"].append([self._ids[row] for row in rows])
+            results["documents"].append([self._documents[row] for row in rows])
+            results["metadatas"].append([self._metadatas[row] for row in rows])
+            results["distances"].append((1.0 - row_scores[top]).tolist())
+            results["embeddings"].append(np.asarray(self._vectors[rows], dtype=np.float32))
+        return {key: value if key == "ids" or key in include else None for key, value in results.items()}
+
+    def get(self, ids=None, where=None, include=("documents", "metadatas")):
+        self._refresh()
+        rows = range(len(self._ids)) if ids is None else [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+        rows = [row for row in rows if matches_where(self._metadatas[row], where)]
+        return {
+            "ids": [self._ids[row] for row in rows],
+            "documents": [self._documents[row] for row in rows] if "documents" in include else None,
+            "metadatas": [self._metadatas[row] for row in rows] if "metadatas" in include else None,
+            "embeddings": np.asarray(self._vectors[rows], dtype=np.float32) if "embeddings" in include else None,
+        }
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        with self._lock:
+            for chunk_id, vector, document, metadata in zip(ids, embeddings, documents, metadatas):
+                # A row's worth of memory, rather than a list of Python floats until the next flush
+                self._pending[chunk_id] = (np.asarray(vector, dtype=self.dtype), document, metadata)
+            self._dirty = True
+
+    def delete(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                self._pending[chunk_id] = None
+            self._dirty = True
+
+    def _apply_pending(self):
+        """Folds buffered upserts and deletes into the matrix in one copy. Caller holds the lock."""
+        if not self._pending:
+            return
+        upserts = {chunk_id: record for chunk_id, record in self._pending.items() if record is not None}
+        deleted = {chunk_id for chunk_id, record in self._pending.items() if record is None} & self._rows.keys()
+
+        existing = self._vectors
+        if deleted:
+            keep = [row for row, chunk_id in enumerate(self._ids) if chunk_id not in deleted]
+            existing = existing[keep]
+            self._ids = [self._ids[row] for row in keep]
+            self._documents = [self._documents[row] for row in keep]
+            self._metadatas = [self._metadatas[row] for row in keep]
+            self._rows = {chunk_id: row for row, chunk_id in enumerate(self._ids)}
+
+        dimension = len(next(iter(upserts.values()))[0]) if upserts else existing.shape[1]
+        vectors = np.asarray([vector for vector, _, _ in upserts.values()], dtype=np.float32).reshape(len(upserts), dimension)
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        for chunk_id in upserts:
+            if chunk_id not in self._rows:
+                self._rows[chunk_id] = len(self._ids)
+                self._ids.append(chunk_id)
+                self._documents.append(None)
+                self._metadatas.append(None)
+        # Writable copy with room for the new rows; the memmap is read-only
+        matrix = np.zeros((len(self._ids), dimension), dtype=self.dtype)
+        if len(existing):
+            matrix[:len(existing)] = existing
+        for (chunk_id, (_, document, metadata)), vector in zip(upserts.items(), vectors):
+            row = self._rows[chunk_id]
+            matrix[row] = vector
+            self._documents[row] = document
+            self._metadatas[row] = metadata
+        self._vectors = matrix
+        self._pending.clear()
+
+    add = upsert
+
+    def flush(self):
+        """Writes the matrix and records; info.json goes last so readers only reload complete data."""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._apply_pending()
+            os.makedirs(self.path, exist_ok=True)
+            np.save(self._file("vectors.tmp.npy"), np.asarray(self._vectors, dtype=self.dtype))
+            os.replace(self._file("vectors.tmp.npy"), self._file("vectors.npy"))
+            self._write_json("records.json", {"ids": self._ids, "documents": self._documents, "metadatas": self._metadatas})
+            self._write_json("info.json", {"metadata": self.metadata, "dtype": self.dtype.name, "count": len(self._ids)})
+            self._dirty = False
+            self._load()
+
+    def _write_json(self, name, data):
+        with open(self._file(f"{name}.tmp"), "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(self._file(f"{name}.tmp"), self._file(name))
+
+
+def open_vector_store(backend=VECTOR_STORE_BACKEND, create=False):
+    """
+    Opens the knowledge base's vector store. With create=True a missing store is created
+    for the current embedding provider; either way it must match that provider.
+    """
+    if backend == "chroma":
+        chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH) # This will save the DB to a local folder
+        try:
+            store = ChromaVectorStore(chroma_client.get_collection(name=CHROMA_COLLECTION_NAME))
+        except NotFoundError:
+            if not create:
+                raise RuntimeError(f"ChromaDB collection '{CHROMA_COLLECTION_NAME}' not found in {CHROMA_DB_PATH}, run `make sync-notion` first")
+            return ChromaVectorStore(chroma_client.create_collection(name=CHROMA_COLLECTION_NAME, metadata=collection_metadata()))
+    elif backend == "numpy":
+        if not os.path.exists(os.path.join(NUMPY_STORE_PATH, "info.json")):
+            if not create:
+                raise RuntimeError(f"No NumPy vector store in {NUMPY_STORE_PATH}, run `make sync-notion` first")
+            return NumpyVectorStore(NUMPY_STORE_PATH, metadata=collection_metadata(), dtype=NUMPY_STORE_DTYPE)
+        store = NumpyVectorStore(NUMPY_STORE_PATH)
+    else:
+        raise ValueError(f"Unknown VECTOR_STORE_BACKEND {backend!r}, expected chroma or numpy")
+
+    # Query vectors must come from the provider that embedded the store
+    check_collection(store)
+    return store
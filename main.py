@@ -1,111 +1,567 @@
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import json
+import logging
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 import openai
 from slack_bolt import App
 from slack_bolt.adapter.socket_mode import SocketModeHandler
-from settings import GPT_MODEL, OPENAI_API_KEY, PERSONAS, SLACK_BOT_TOKEN, SLACK_APP_TOKEN
+from slack_bolt.adapter.socket_mode.async_handler import AsyncSocketModeHandler
+from slack_bolt.async_app import AsyncApp
+from lib.answer_cache import AnswerCache
+from lib.context_assembly import context_chunks
+from lib.dedupe import AsyncSingleFlight, SingleFlight, TTLKeyStore
+from lib.embeddings import embed_query
+from lib.prompt_builder import build_prompt, get_tokenizer
+from lib.retriever import PlaceholderRetriever, get_retriever
+from lib.scheduler import AsyncMentionScheduler, MentionScheduler
+from lib.streaming import AsyncMessageStreamer, MessageStreamer
+from lib.telemetry import register_gauge, set_attributes, setup_telemetry, stage, traced
+from lib.thread_history import ThreadHistoryStore
+from settings import (
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_TTL_SECONDS,
+    ASYNC_MODE, COALESCE_COMPLETIONS, GPT_MODEL, HISTORY_MESSAGES, MULTI_PERSONA_FANOUT,
+    EVENT_DEDUPE_ENABLED, EVENT_DEDUPE_MAX_KEYS, EVENT_DEDUPE_TTL_SECONDS,
+    MAX_CONCURRENT_COMPLETIONS, SCHEDULER_ENABLED, SCHEDULER_MAX_QUEUE_DEPTH, SCHEDULER_WORKERS,
+    OPENAI_API_KEY, PERSONAS, RETRIEVER_BACKEND, RETRIEVER_WARM_UP, SLACK_BOT_TOKEN, SLACK_APP_TOKEN,
+    STREAM_RESPONSES, STREAM_UPDATES_PER_SECOND, SYNC_MARKER_PATH,
+    THREAD_HISTORY_ENABLED, THREAD_HISTORY_MAX_MESSAGES, THREAD_HISTORY_MAX_THREADS
+)
 
 # --- Initialization ---
-app = App(token=SLACK_BOT_TOKEN)
+log = logging.getLogger(__name__)
 openai.api_key = OPENAI_API_KEY
+async_openai = openai.AsyncOpenAI(api_key=OPENAI_API_KEY) if ASYNC_MODE else None
+retriever = get_retriever()
+answer_cache = AnswerCache(
+    similarity_threshold=ANSWER_CACHE_SIMILARITY,
+    max_entries=ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+    sync_marker_path=SYNC_MARKER_PATH
+) if ANSWER_CACHE_ENABLED else None
+thread_history = ThreadHistoryStore(
+    max_threads=THREAD_HISTORY_MAX_THREADS,
+    max_messages=THREAD_HISTORY_MAX_MESSAGES
+) if THREAD_HISTORY_ENABLED else None
+scheduler = (AsyncMentionScheduler if ASYNC_MODE else MentionScheduler)(
+    workers=SCHEDULER_WORKERS,
+    max_queue_depth=SCHEDULER_MAX_QUEUE_DEPTH,
+    max_concurrent_completions=MAX_CONCURRENT_COMPLETIONS
+) if SCHEDULER_ENABLED else None
+seen_events = TTLKeyStore(
+    ttl_seconds=EVENT_DEDUPE_TTL_SECONDS,
+    max_keys=EVENT_DEDUPE_MAX_KEYS
+) if EVENT_DEDUPE_ENABLED else None
+in_flight = (AsyncSingleFlight if ASYNC_MODE else SingleFlight)() if COALESCE_COMPLETIONS else None
 
+if answer_cache:
+    register_gauge("answer_cache.hit_rate", lambda: answer_cache.stats()["hit_rate"])
+if scheduler:
+    register_gauge("scheduler.queue_depth", lambda: scheduler.stats()["queue_depth"])
+    register_gauge("scheduler.in_flight", lambda: scheduler.stats()["in_flight"])
+    register_gauge("scheduler.wait_p95_seconds", lambda: scheduler.stats()["wait_p95"])
 
-# --- Placeholder for your RAG logic ---
-def retrieve_from_knowledge_base(query: str) -> str:
+QUEUE_FULL_MESSAGE = "I'm handling a lot of questions right now, please try again shortly."
+
+
+# --- RAG ---
+def retrieve_from_knowledge_base(query: str, filters=None):
     """
-    Searches your knowledge base (e.g., a vector database) and returns relevant context.
+    Searches the knowledge base with the RETRIEVER_BACKEND retriever. Returns the most relevant
+    chunks, best first, as {"id", "document", "metadata"} dicts (the placeholder retriever,
+    which has no chunks, returns its context string instead).
+    """
+    if isinstance(retriever, PlaceholderRetriever):
+        return retriever.retrieve(query, filters=filters)
+    return retriever.retrieve_many([query], filters=filters)[0]
+
+def retrieve_for_personas(personas, query):
+    """
+    Returns one context per persona, searched with the persona's "filters" from personas.json.
+    Personas with the same filters share a single retrieval; different filters are searched in parallel.
+    """
+    keys = [json.dumps(persona.get('filters'), sort_keys=True) for persona in personas]
+    filters = {key: persona.get('filters') for key, persona in zip(keys, personas)}
+    if len(filters) == 1:
+        contexts = {key: retrieve_from_knowledge_base(query, filters=value) for key, value in filters.items()}
+    else:
+        # Each search runs in a copy of this context, so its spans stay under the retrieval span
+        with ThreadPoolExecutor(max_workers=len(filters)) as pool:
+            futures = {
+                key: pool.submit(contextvars.copy_context().run, retrieve_from_knowledge_base, query, value)
+                for key, value in filters.items()
+            }
+            contexts = {key: future.result() for key, future in futures.items()}
+    return [contexts[key] for key in keys]
+
+# --- Shared helpers ---
+def resolve_personas(user_query, logger):
+    """
+    Returns (personas, clean_query) for the mentioned bots, or ([], None).
+    Only the first mention is used unless MULTI_PERSONA_FANOUT is enabled.
     """
-    print(f"Searching knowledge base for: {query}")
-    # In a real app, this would query something like Pinecone, ChromaDB, etc.
-    # For now, we'll return some dummy context.
-    if "hiring" in query.lower():
-        return "Context: The Q4 hiring plan prioritizes two senior backend engineers and one product marketing manager. Budget has been approved."
-    return "Context: No specific information found on that topic."
-
-# --- Slack Event Listener ---
-@app.event("app_mention")
-def handle_app_mention_events(body, client, say, logger):
-    event = body['event']
-    channel_id = event['channel']
-    thread_ts = event.get('thread_ts', event['ts'])
-    user_query = event['text']
-    
-    # 1. Identify which bot was mentioned
     mentioned_users = re.findall(r"<@(\w+)>", user_query)
     if not mentioned_users:
-        return # Should not happen in an app_mention event
-    
-    bot_user_id = mentioned_users[0]
-    persona = PERSONAS.get(bot_user_id)
-    
-    if not persona:
-        logger.warning(f"Mentioned user {bot_user_id} not found in PERSONAS.")
-        return
+        return [], None # Should not happen in an app_mention event
+
+    if MULTI_PERSONA_FANOUT:
+        bot_user_ids = [user_id for user_id in dict.fromkeys(mentioned_users) if user_id in PERSONAS]
+    else:
+        bot_user_ids = [mentioned_users[0]] if mentioned_users[0] in PERSONAS else []
+
+    if not bot_user_ids:
+        logger.warning(f"Mentioned user {mentioned_users[0]} not found in PERSONAS.")
+        return [], None
+
+    # Clean the user query to remove the @mentions
+    clean_query = user_query
+    for bot_user_id in bot_user_ids:
+        clean_query = clean_query.replace(f"<@{bot_user_id}>", "")
+    clean_query = clean_query.strip()
+    personas = [PERSONAS[bot_user_id] for bot_user_id in bot_user_ids]
+
+    log.debug("User query: %s", clean_query)
+    for persona in personas:
+        log.debug("Using persona: %s", persona['name'])
+        log.debug("System prompt: %s", persona['system_prompt'])
+    log.debug("Mentioned Users: %s", mentioned_users)
+
+    return personas, clean_query
+
+def build_messages(persona, conversation_history, rag_context, clean_query):
+    """Builds the chat completion messages within the prompt token budgets."""
+    with stage("prompt.build"):
+        # Each page span is its own ranked chunk, so the lowest-ranked ones are dropped to fit the budget
+        chunks = [rag_context] if isinstance(rag_context, str) else context_chunks(rag_context)
+        messages_for_api, token_report = build_prompt(persona['system_prompt'], conversation_history, chunks, clean_query)
+        set_attributes(**{f"tokens.{section}": count for section, count in token_report.items()})
+    log.debug("Prompt tokens (%s): %s", persona['name'], token_report)
+    return messages_for_api
+
+def context_chunk_ids(rag_context):
+    """Identifies the retrieved context, so cached answers are only reused for the same chunks."""
+    if isinstance(rag_context, str): # The placeholder retriever has no chunk IDs, so key on the context text itself
+        return (hashlib.sha1(rag_context.encode("utf-8")).hexdigest(),)
+    return tuple(chunk["id"] for chunk in rag_context)
+
+def lookup_cached_answer(persona, query_embedding, chunk_ids):
+    """Checks the answer cache and logs its counters."""
+    with stage("answer_cache.lookup", persona=persona['name']):
+        cached_answer = answer_cache.lookup(persona['name'], query_embedding, chunk_ids)
+        set_attributes(cache_hit=cached_answer is not None)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Answer cache %s: %s", 'hit' if cached_answer else 'miss', answer_cache.stats())
+    return cached_answer
+
+def fetch_conversation_history(client, channel_id, thread_ts, event):
+    """Returns the most recent message texts for the prompt, oldest first."""
+    if not thread_history:
+        history = client.conversations_history(channel=channel_id, limit=HISTORY_MESSAGES)
+        return [msg['text'] for msg in reversed(history['messages'])]
 
-    # Clean the user query to remove the @mention
-    clean_query = user_query.replace(f"<@{bot_user_id}>", "").strip()
-
-    print(f"[DEBUG] User query: {clean_query}")
-    print(f"[DEBUG] Using persona: {persona['name']}")
-    print(f"[DEBUG] System prompt: {persona['system_prompt']}")
-    print(f"[DEBUG] Channel ID: {channel_id}, Thread TS: {thread_ts}")
-    print(f"[DEBUG] Mentioned Users: {mentioned_users}")
-    print("-----")
-
-    try:
-        # Give a visual cue that the bot is thinking
-        thinking_message = say(text=f"Thinking as the {persona['name']}...", thread_ts=thread_ts)
-
-        # 2. Retrieve context with your RAG mechanism
-        rag_context = retrieve_from_knowledge_base(clean_query)
-
-        print(f"[DEBUG] RAG Context: {rag_context}")
-
-        # 3. Fetch conversation history
-        history = client.conversations_history(channel=channel_id, limit=5)
-        conversation_history = [msg['text'] for msg in reversed(history['messages'])]
-
-        # 4. Build the prompt and call the OpenAI API
-        messages_for_api = [
-            {"role": "system", "content": persona['system_prompt']},
-            {"role": "user", "content": f"""
-            Here is the recent conversation history:
-            ---
-            {"\n".join(conversation_history)}
-            ---
-            
-            Here is some internal knowledge that might be relevant:
-            ---
-            {rag_context}
-            ---
-
-            Based on all of this, please answer my latest question: "{clean_query}"
-            """}
-        ]
-        
+    # The mention can arrive before its own `message` event
+    thread_history.add_message(channel_id, thread_ts, event['ts'], event['text'])
+    conversation_history = thread_history.get(channel_id, thread_ts)
+    set_attributes(cache_hit=conversation_history is not None)
+    if conversation_history is None:
+        cursor = None
+        while True:
+            replies = client.conversations_replies(channel=channel_id, ts=thread_ts, limit=200, cursor=cursor)
+            conversation_history = thread_history.fill(channel_id, thread_ts, replies['messages'])
+            cursor = replies.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                break
+    return conversation_history[-HISTORY_MESSAGES:]
+
+async def async_fetch_conversation_history(client, channel_id, thread_ts, event):
+    """Async variant of fetch_conversation_history."""
+    if not thread_history:
+        history = await client.conversations_history(channel=channel_id, limit=HISTORY_MESSAGES)
+        return [msg['text'] for msg in reversed(history['messages'])]
+
+    thread_history.add_message(channel_id, thread_ts, event['ts'], event['text'])
+    conversation_history = thread_history.get(channel_id, thread_ts)
+    set_attributes(cache_hit=conversation_history is not None)
+    if conversation_history is None:
+        cursor = None
+        while True:
+            replies = await client.conversations_replies(channel=channel_id, ts=thread_ts, limit=200, cursor=cursor)
+            conversation_history = thread_history.fill(channel_id, thread_ts, replies['messages'])
+            cursor = replies.get('response_metadata', {}).get('next_cursor')
+            if not cursor:
+                break
+    return conversation_history[-HISTORY_MESSAGES:]
+
+def remember_answer(channel_id, thread_ts, ts, answer):
+    """Records the bot's own answer in the thread cache (Bolt drops events from this bot)."""
+    if thread_history:
+        thread_history.add_message(channel_id, thread_ts, ts, answer)
+
+def completion_slot():
+    """Caps concurrent OpenAI completions across all workers when the scheduler is on."""
+    return scheduler.completion_slot() if scheduler else contextlib.nullcontext()
+
+def scheduling_keys(event):
+    """Fair-queue keys for a mention: its channel, then the first mentioned persona."""
+    mentioned_users = re.findall(r"<@(\w+)>", event['text'])
+    return (event['channel'], mentioned_users[0] if mentioned_users else None)
+
+def record_usage(usage):
+    """Adds the completion's token usage to the current span."""
+    if usage:
+        set_attributes(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+def stream_completion(client, channel_id, ts, messages, logger):
+    """Streams the completion into the message at `ts` and returns (answer, posted)."""
+    streamer = MessageStreamer(client, channel_id, ts, STREAM_UPDATES_PER_SECOND, logger)
+    started = time.perf_counter()
+    stream = openai.chat.completions.create(
+        model=GPT_MODEL, messages=messages, stream=True, stream_options={"include_usage": True}
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if not streamer.text:
+                set_attributes(first_token_ms=(time.perf_counter() - started) * 1000)
+            streamer.append(chunk.choices[0].delta.content)
+        record_usage(getattr(chunk, "usage", None))
+    return streamer.finish(), streamer.posted
+
+async def async_stream_completion(client, channel_id, ts, messages, logger):
+    """Async variant of stream_completion."""
+    streamer = AsyncMessageStreamer(client, channel_id, ts, STREAM_UPDATES_PER_SECOND, logger)
+    started = time.perf_counter()
+    stream = await async_openai.chat.completions.create(
+        model=GPT_MODEL, messages=messages, stream=True, stream_options={"include_usage": True}
+    )
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            if not streamer.text:
+                set_attributes(first_token_ms=(time.perf_counter() - started) * 1000)
+            await streamer.append(chunk.choices[0].delta.content)
+        record_usage(getattr(chunk, "usage", None))
+    return await streamer.finish(), streamer.posted
+
+def run_completion(client, channel_id, ts, messages_for_api, logger):
+    """Returns (answer, posted); posted is True when the answer was streamed into the message at `ts`."""
+    with completion_slot(), stage("completion", model=GPT_MODEL, streamed=STREAM_RESPONSES):
+        if STREAM_RESPONSES:
+            # Edit the "Thinking..." message as tokens arrive
+            return stream_completion(client, channel_id, ts, messages_for_api, logger)
         response = openai.chat.completions.create(
             model=GPT_MODEL,
             messages=messages_for_api
         )
-        api_response = response.choices[0].message.content
+        record_usage(getattr(response, "usage", None))
+        return response.choices[0].message.content, False
 
-        print(f"[DEBUG] API Response: {api_response}")
+async def async_run_completion(client, channel_id, ts, messages_for_api, logger):
+    """Async variant of run_completion."""
+    async with completion_slot():
+        with stage("completion", model=GPT_MODEL, streamed=STREAM_RESPONSES):
+            if STREAM_RESPONSES:
+                return await async_stream_completion(client, channel_id, ts, messages_for_api, logger)
+            response = await async_openai.chat.completions.create(
+                model=GPT_MODEL,
+                messages=messages_for_api
+            )
+            record_usage(getattr(response, "usage", None))
+            return response.choices[0].message.content, False
 
-        # Update the "Thinking..." message with the final answer
-        client.chat_update(
-            channel=channel_id,
-            ts=thinking_message['ts'],
-            text=api_response
-        )
+def coalescing_key(persona, clean_query, conversation_history):
+    """Identical questions only share an answer when they were asked with the same thread history."""
+    history_hash = hashlib.sha1(json.dumps(conversation_history).encode("utf-8")).hexdigest()
+    return (persona['name'], " ".join(clean_query.lower().split()), history_hash)
 
-    except Exception as e:
-        logger.error(f"Error handling app_mention: {e}")
-        client.chat_update(
-            channel=channel_id,
-            ts=thinking_message['ts'], # Fails if thinking_message wasn't posted
-            text="Sorry, I ran into an error!"
-        )
+def is_duplicate_event(body):
+    """True if this event_id or client_msg_id was already delivered."""
+    keys = [key for key in (body.get('event_id'), body['event'].get('client_msg_id')) if key]
+    return any([seen_events.check_and_add(key) for key in keys])
+
+# --- Mention handling ---
+def answer_as_persona(client, channel_id, thread_ts, persona, thinking_message, clean_query,
+                      conversation_history, rag_context, query_embedding, chunk_ids, logger):
+    """Runs the completion for one persona and posts its answer into its "Thinking..." message."""
+    with stage("persona", persona=persona['name']):
+        try:
+            # 4. Build the prompt and call the OpenAI API
+            messages_for_api = build_messages(persona, conversation_history, rag_context, clean_query)
+
+            completion_args = (client, channel_id, thinking_message['ts'], messages_for_api, logger)
+            if in_flight:
+                # Wait for an identical request that is already running instead of starting another completion
+                (api_response, posted), shared = in_flight.do(coalescing_key(persona, clean_query, conversation_history), run_completion, *completion_args)
+                set_attributes(coalesced=shared)
+                posted = posted and not shared
+            else:
+                api_response, posted = run_completion(*completion_args)
+
+            if not posted:
+                # Update the "Thinking..." message with the final answer
+                with stage("slack.chat_update"):
+                    client.chat_update(
+                        channel=channel_id,
+                        ts=thinking_message['ts'],
+                        text=api_response
+                    )
+
+            log.debug("API Response (%s): %s", persona['name'], api_response)
+            remember_answer(channel_id, thread_ts, thinking_message['ts'], api_response)
+
+            if answer_cache:
+                answer_cache.store(persona['name'], query_embedding, chunk_ids, api_response)
+
+        except Exception as e:
+            logger.error(f"Error answering as {persona['name']}: {e}")
+            client.chat_update(
+                channel=channel_id,
+                ts=thinking_message['ts'],
+                text="Sorry, I ran into an error!"
+            )
+
+def answer_mention(body, client, say, logger):
+    event = body['event']
+    channel_id = event['channel']
+    thread_ts = event.get('thread_ts', event['ts'])
+
+    # 1. Identify which bot(s) were mentioned
+    personas, clean_query = resolve_personas(event['text'], logger)
+    if not personas:
+        return
+
+    log.debug("Channel ID: %s, Thread TS: %s", channel_id, thread_ts)
+
+    thinking_messages = []
+    with stage("mention", channel=channel_id, personas=[persona['name'] for persona in personas]):
+        try:
+            # Give a visual cue that the bot is thinking
+            with stage("slack.post_placeholder"):
+                for persona in personas:
+                    thinking_messages.append(say(text=f"Thinking as the {persona['name']}...", thread_ts=thread_ts))
+
+            # 2. Retrieve context with your RAG mechanism (shared by personas with the same filters)
+            with stage("retrieval"):
+                rag_contexts = retrieve_for_personas(personas, clean_query)
+
+            log.debug("RAG Context: %s", rag_contexts)
+
+            # Reuse earlier answers to a near-identical question over the same context
+            query_embedding = None
+            if answer_cache:
+                with stage("embed_query"):
+                    query_embedding = embed_query(clean_query)
+            pending = []
+            for persona, thinking_message, rag_context in zip(personas, thinking_messages, rag_contexts):
+                chunk_ids = context_chunk_ids(rag_context)
+                cached_answer = lookup_cached_answer(persona, query_embedding, chunk_ids) if answer_cache else None
+                if cached_answer:
+                    with stage("slack.chat_update"):
+                        client.chat_update(channel=channel_id, ts=thinking_message['ts'], text=cached_answer)
+                    remember_answer(channel_id, thread_ts, thinking_message['ts'], cached_answer)
+                else:
+                    pending.append((persona, thinking_message, rag_context, chunk_ids))
+            if not pending:
+                return
+
+            # 3. Fetch conversation history
+            with stage("slack.history"):
+                conversation_history = fetch_conversation_history(client, channel_id, thread_ts, event)
+
+            persona_args = [
+                (client, channel_id, thread_ts, persona, thinking_message, clean_query,
+                 conversation_history, rag_context, query_embedding, chunk_ids, logger)
+                for persona, thinking_message, rag_context, chunk_ids in pending
+            ]
+            if len(persona_args) == 1:
+                answer_as_persona(*persona_args[0])
+                return
+
+            # Several personas were mentioned: run their completions in parallel
+            # (each in a copy of this context, so their spans stay under the mention's span)
+            with ThreadPoolExecutor(max_workers=len(persona_args)) as pool:
+                for args in persona_args:
+                    pool.submit(contextvars.copy_context().run, answer_as_persona, *args)
+
+        except Exception as e:
+            logger.error(f"Error handling app_mention: {e}")
+            for thinking_message in thinking_messages:
+                client.chat_update(
+                    channel=channel_id,
+                    ts=thinking_message['ts'],
+                    text="Sorry, I ran into an error!"
+                )
+
+async def async_answer_as_persona(client, channel_id, thread_ts, persona, thinking_message, clean_query,
+                                  conversation_history, rag_context, query_embedding, chunk_ids, logger):
+    """Async variant of answer_as_persona."""
+    with stage("persona", persona=persona['name']):
+        try:
+            messages_for_api = build_messages(persona, conversation_history, rag_context, clean_query)
+
+            completion_args = (client, channel_id, thinking_message['ts'], messages_for_api, logger)
+            if in_flight:
+                (api_response, posted), shared = await in_flight.do(coalescing_key(persona, clean_query, conversation_history), async_run_completion, *completion_args)
+                set_attributes(coalesced=shared)
+                posted = posted and not shared
+            else:
+                api_response, posted = await async_run_completion(*completion_args)
+
+            if not posted:
+                with stage("slack.chat_update"):
+                    await client.chat_update(
+                        channel=channel_id,
+                        ts=thinking_message['ts'],
+                        text=api_response
+                    )
+
+            log.debug("API Response (%s): %s", persona['name'], api_response)
+            remember_answer(channel_id, thread_ts, thinking_message['ts'], api_response)
+
+            if answer_cache:
+                answer_cache.store(persona['name'], query_embedding, chunk_ids, api_response)
+
+        except Exception as e:
+            logger.error(f"Error answering as {persona['name']}: {e}")
+            await client.chat_update(
+                channel=channel_id,
+                ts=thinking_message['ts'],
+                text="Sorry, I ran into an error!"
+            )
+
+async def async_answer_mention(body, client, say, logger):
+    """Async variant of answer_mention used when ASYNC_MODE is enabled."""
+    event = body['event']
+    channel_id = event['channel']
+    thread_ts = event.get('thread_ts', event['ts'])
+
+    personas, clean_query = resolve_personas(event['text'], logger)
+    if not personas:
+        return
+
+    log.debug("Channel ID: %s, Thread TS: %s", channel_id, thread_ts)
+
+    thinking_messages = []
+    with stage("mention", channel=channel_id, personas=[persona['name'] for persona in personas]):
+        try:
+            # Retrieve context, fetch history, embed the query and post the placeholders at the same time
+            results = await asyncio.gather(
+                traced("retrieval", asyncio.to_thread(retrieve_for_personas, personas, clean_query)),
+                traced("slack.history", async_fetch_conversation_history(client, channel_id, thread_ts, event)),
+                traced("embed_query", asyncio.to_thread(embed_query, clean_query)) if answer_cache else asyncio.sleep(0),
+                *[
+                    traced("slack.post_placeholder", say(text=f"Thinking as the {persona['name']}...", thread_ts=thread_ts))
+                    for persona in personas
+                ],
+                return_exceptions=True
+            )
+            rag_contexts, conversation_history, query_embedding, *placeholders = results
+            thinking_messages = [placeholder for placeholder in placeholders if not isinstance(placeholder, BaseException)]
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+
+            log.debug("RAG Context: %s", rag_contexts)
+
+            pending = []
+            for persona, thinking_message, rag_context in zip(personas, thinking_messages, rag_contexts):
+                chunk_ids = context_chunk_ids(rag_context)
+                cached_answer = lookup_cached_answer(persona, query_embedding, chunk_ids) if answer_cache else None
+                if cached_answer:
+                    with stage("slack.chat_update"):
+                        await client.chat_update(channel=channel_id, ts=thinking_message['ts'], text=cached_answer)
+                    remember_answer(channel_id, thread_ts, thinking_message['ts'], cached_answer)
+                else:
+                    pending.append((persona, thinking_message, rag_context, chunk_ids))
+
+            # One completion per persona, all in flight at once
+            await asyncio.gather(*[
+                async_answer_as_persona(
+                    client, channel_id, thread_ts, persona, thinking_message, clean_query,
+                    conversation_history, rag_context, query_embedding, chunk_ids, logger
+                )
+                for persona, thinking_message, rag_context, chunk_ids in pending
+            ])
+
+        except Exception as e:
+            logger.error(f"Error handling app_mention: {e}")
+            for thinking_message in thinking_messages:
+                await client.chat_update(
+                    channel=channel_id,
+                    ts=thinking_message['ts'],
+                    text="Sorry, I ran into an error!"
+                )
+
+# --- Slack Event Listeners ---
+def handle_app_mention_events(body, client, say, logger):
+    if seen_events and is_duplicate_event(body):
+        logger.info(f"Dropping redelivered event {body.get('event_id')}")
+        return
+
+    if not scheduler:
+        return answer_mention(body, client, say, logger)
+
+    # Hand the mention to the worker pool so the listener returns straight away
+    event = body['event']
+    if not scheduler.submit(scheduling_keys(event), answer_mention, body, client, say, logger):
+        say(text=QUEUE_FULL_MESSAGE, thread_ts=event.get('thread_ts', event['ts']))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Scheduler: %s", scheduler.stats())
+
+async def async_handle_app_mention_events(body, client, say, logger):
+    if seen_events and is_duplicate_event(body):
+        logger.info(f"Dropping redelivered event {body.get('event_id')}")
+        return
+
+    if not scheduler:
+        return await async_answer_mention(body, client, say, logger)
+
+    event = body['event']
+    if not scheduler.submit(scheduling_keys(event), async_answer_mention, body, client, say, logger):
+        await say(text=QUEUE_FULL_MESSAGE, thread_ts=event.get('thread_ts', event['ts']))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Scheduler: %s", scheduler.stats())
+
+def handle_message_events(event):
+    """Keeps the thread history cache current from new, edited and deleted messages."""
+    thread_history.record_event(event)
+
+async def async_handle_message_events(event):
+    thread_history.record_event(event)
+
+def create_app():
+    """Builds the Bolt app for the configured mode and registers the listeners."""
+    if ASYNC_MODE:
+        app = AsyncApp(token=SLACK_BOT_TOKEN)
+        app.event("app_mention")(async_handle_app_mention_events)
+        if thread_history:
+            app.event("message")(async_handle_message_events)
+    else:
+        app = App(token=SLACK_BOT_TOKEN)
+        app.event("app_mention")(handle_app_mention_events)
+        if thread_history:
+            app.event("message")(handle_message_events)
+    return app
 
 # --- Start the App ---
 if __name__ == "__main__":
-    handler = SocketModeHandler(app, SLACK_APP_TOKEN)
-    handler.start()
+    setup_telemetry()
+    get_tokenizer() # Load it now rather than inside the first mention
+    if RETRIEVER_WARM_UP:
+        try:
+            retriever.warm_up()
+        except Exception as e:
+            if RETRIEVER_BACKEND == "chroma":
+                # Every mention would fail at retrieval, better to stop here
+                raise SystemExit(f"Retriever warm-up failed, run `make sync-notion` first or set RETRIEVER_BACKEND=placeholder: {e}")
+            log.warning(f"Retriever warm-up failed, continuing without it: {e}")
+    app = create_app()
+    if ASYNC_MODE:
+        # Every mention runs as its own task on the event loop, so slow completions
+        # no longer hold up other mentions.
+        asyncio.run(AsyncSocketModeHandler(app, SLACK_APP_TOKEN).start_async())
+    else:
+        handler = SocketModeHandler(app, SLACK_APP_TOKEN)
+        handler.start()
@@ -10,11 +10,117 @@ SLACK_APP_TOKEN = os.environ.get("SLACK_APP_TOKEN")
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 NOTION_API_TOKEN = os.environ.get("NOTION_API_TOKEN")
 NOTION_DATABASE_ID = os.environ.get("NOTION_DATABASE_ID")
-CHROMA_DB_PATH = "./notion_db" # Path to store ChromaDB data
+CHROMA_DB_PATH = os.environ.get("CHROMA_DB_PATH", "./notion_db") # Path to store ChromaDB data
 CHROMA_COLLECTION_NAME = "notion-knowledge-base"
+SYNC_MARKER_PATH = os.path.join(CHROMA_DB_PATH, ".last_sync") # Touched by sync_notion.py after every sync
+SYNC_MANIFEST_PATH = os.path.join(CHROMA_DB_PATH, "sync_manifest.json") # Pages and chunk hashes already in the vector store
+VECTOR_STORE_BACKEND = os.environ.get("VECTOR_STORE_BACKEND", "chroma") # "chroma" or "numpy" (exact top-k over a memory-mapped matrix)
+NUMPY_STORE_PATH = os.environ.get("NUMPY_STORE_PATH", os.path.join(CHROMA_DB_PATH, "numpy_store"))
+NUMPY_STORE_DTYPE = os.environ.get("NUMPY_STORE_DTYPE", "float32") # "float16" halves memory and disk
+EMBEDDING_PROVIDER = os.environ.get("EMBEDDING_PROVIDER", "openai") # "openai" or "onnx"; re-sync after changing it
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "text-embedding-3-small") # OpenAI embedding model
+ONNX_EMBEDDING_MODEL_DIR = os.environ.get("ONNX_EMBEDDING_MODEL_DIR", "./models/all-MiniLM-L6-v2") # Holds model.onnx and tokenizer.json
+ONNX_EMBEDDING_BATCH_SIZE = int(os.environ.get("ONNX_EMBEDDING_BATCH_SIZE", "32"))
+ONNX_EMBEDDING_WORKERS = int(os.environ.get("ONNX_EMBEDDING_WORKERS", "2")) # Batches embedded in parallel
+ONNX_EMBEDDING_MAX_LENGTH = int(os.environ.get("ONNX_EMBEDDING_MAX_LENGTH", "256")) # Tokens per text
+EMBEDDING_MAX_RETRIES = int(os.environ.get("EMBEDDING_MAX_RETRIES", "5")) # Retries on rate limits (429), server errors (5xx) and timeouts
+EMBEDDING_RETRY_BASE_SECONDS = float(os.environ.get("EMBEDDING_RETRY_BASE_SECONDS", "1.0")) # Doubles on every retry
+EMBEDDING_QUERY_MAX_RETRIES = int(os.environ.get("EMBEDDING_QUERY_MAX_RETRIES", "1")) # For query embeddings, which a mention waits on; EMBEDDING_MAX_RETRIES is for syncs
+EMBEDDING_QUERY_MAX_DELAY_SECONDS = float(os.environ.get("EMBEDDING_QUERY_MAX_DELAY_SECONDS", "2.0")) # Longest wait before retrying a query embedding, whatever Retry-After says
+# sync_notion.py embeds chunks in token-bounded batches and writes them in bulk
+SYNC_EMBEDDING_BATCH_TOKENS = int(os.environ.get("SYNC_EMBEDDING_BATCH_TOKENS", "50000")) # Tokens per embeddings request
+SYNC_EMBEDDING_BATCH_SIZE = int(os.environ.get("SYNC_EMBEDDING_BATCH_SIZE", "512")) # Chunks per embeddings request (OpenAI allows 2048)
+SYNC_UPSERT_BATCH_SIZE = int(os.environ.get("SYNC_UPSERT_BATCH_SIZE", "1000")) # Chunks per vector store upsert
+CHUNK_MAX_TOKENS = int(os.environ.get("CHUNK_MAX_TOKENS", "300")) # Page text per chunk; sections that fit are kept whole. Lowered to fit the embedding model's input
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", "40")) # Repeated from the previous chunk when a section is split (keep under half of CHUNK_MAX_TOKENS)
+SYNC_EMBEDDING_WORKERS = int(os.environ.get("SYNC_EMBEDDING_WORKERS", "4")) # Embeddings requests in flight at once
+SYNC_QUEUE_SIZE = int(os.environ.get("SYNC_QUEUE_SIZE", "16")) # Items (pages or chunk batches) held between sync pipeline stages
+NOTION_REQUESTS_PER_SECOND = float(os.environ.get("NOTION_REQUESTS_PER_SECOND", "3")) # Notion's average rate limit per integration
+NOTION_FETCH_WORKERS = int(os.environ.get("NOTION_FETCH_WORKERS", "8")) # Pages fetched at once by sync_notion.py
+NOTION_MAX_RETRIES = int(os.environ.get("NOTION_MAX_RETRIES", "5")) # Retries on rate limits (429), server errors (5xx) and timeouts
 
-PERSONAS = json.loads(open("personas.json").read())
+# Query embedding cache: in-memory LRU in front of a SQLite file that survives restarts
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", os.path.join(CHROMA_DB_PATH, "query_embeddings.sqlite3"))
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MEMORY_ENTRIES", "1024"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", "100000")) # Rows kept on disk
+
+# Document embedding store: chunk embeddings by model and text, reused by syncs, rebuilds and evals
+EMBEDDING_STORE_ENABLED = os.environ.get("EMBEDDING_STORE_ENABLED", "true").lower() == "true"
+EMBEDDING_STORE_PATH = os.environ.get("EMBEDDING_STORE_PATH", "./embedding_store.sqlite3") # Outside CHROMA_DB_PATH, so rebuilding that keeps the vectors
+EMBEDDING_STORE_MAX_MB = int(os.environ.get("EMBEDDING_STORE_MAX_MB", "2048")) # Least recently used embeddings are evicted past this
+
+# Knowledge base retrieval: "chroma" (in-process), "socket" (shared `python lib/retriever.py` process) or "placeholder"
+RETRIEVER_BACKEND = os.environ.get("RETRIEVER_BACKEND", "placeholder")
+RETRIEVER_SOCKET_PATH = os.environ.get("RETRIEVER_SOCKET_PATH", "/tmp/c-suite-retriever.sock")
+RETRIEVER_WARM_UP = os.environ.get("RETRIEVER_WARM_UP", "true").lower() == "true" # Load the index and run a query at startup
+
+# Hybrid retrieval: BM25 index built by sync_notion.py, fused with the vector search by reciprocal rank
+HYBRID_RETRIEVAL_ENABLED = os.environ.get("HYBRID_RETRIEVAL_ENABLED", "true").lower() == "true"
+BM25_INDEX_PATH = os.environ.get("BM25_INDEX_PATH", os.path.join(CHROMA_DB_PATH, "bm25_index.json"))
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", "10")) # Results taken from each ranking before fusion
+RRF_K = int(os.environ.get("RRF_K", "60"))
+# Skip the embedding call when the top BM25 hit has every query term and beats the runner-up by this factor (0 disables)
+LEXICAL_SHORTCUT_RATIO = float(os.environ.get("LEXICAL_SHORTCUT_RATIO", "3.0"))
+# Context assembly: over-fetch candidates and pick a diverse subset with maximal marginal relevance
+MMR_ENABLED = os.environ.get("MMR_ENABLED", "true").lower() == "true"
+MMR_CANDIDATES = int(os.environ.get("MMR_CANDIDATES", "12")) # Candidates fetched before MMR picks the final chunks
+MMR_LAMBDA = float(os.environ.get("MMR_LAMBDA", "0.7")) # 1.0 is pure relevance, lower values favour diversity
+
+PERSONAS_FILE = os.environ.get("PERSONAS_FILE", "personas.json")
+PERSONAS = json.loads(open(PERSONAS_FILE).read())
 
 GPT_MODEL = os.environ.get("GPT_MODEL", "gpt-4.1-nano") # Default to gpt-4.1-nano if not set
 
 NOTION_DOCUMENTATION_DB_ID = os.environ.get("NOTION_DOCUMENTATION_DB_ID")
+
+# Run the bot on Bolt's AsyncApp / AsyncSocketModeHandler instead of the sync App
+ASYNC_MODE = os.environ.get("ASYNC_MODE", "false").lower() == "true"
+
+# Stream completion tokens into the "Thinking..." message instead of waiting for the full answer
+STREAM_RESPONSES = os.environ.get("STREAM_RESPONSES", "false").lower() == "true"
+STREAM_UPDATES_PER_SECOND = float(os.environ.get("STREAM_UPDATES_PER_SECOND", "1")) # Max chat_update calls per second per message
+
+# Semantic answer cache in front of the completion call
+ANSWER_CACHE_ENABLED = os.environ.get("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+ANSWER_CACHE_SIMILARITY = float(os.environ.get("ANSWER_CACHE_SIMILARITY", "0.95")) # Cosine similarity needed for a hit
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get("ANSWER_CACHE_MAX_ENTRIES", "512"))
+ANSWER_CACHE_TTL_SECONDS = int(os.environ.get("ANSWER_CACHE_TTL_SECONDS", "3600"))
+
+# Conversation history
+HISTORY_MESSAGES = int(os.environ.get("HISTORY_MESSAGES", "5")) # Recent messages included in the prompt
+THREAD_HISTORY_ENABLED = os.environ.get("THREAD_HISTORY_ENABLED", "false").lower() == "true" # Needs message.* event subscriptions
+THREAD_HISTORY_MAX_THREADS = int(os.environ.get("THREAD_HISTORY_MAX_THREADS", "256"))
+THREAD_HISTORY_MAX_MESSAGES = int(os.environ.get("THREAD_HISTORY_MAX_MESSAGES", "50"))
+
+# Mention scheduler: worker pool with per-channel/per-persona fair queues
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "false").lower() == "true"
+SCHEDULER_WORKERS = int(os.environ.get("SCHEDULER_WORKERS", "8"))
+SCHEDULER_MAX_QUEUE_DEPTH = int(os.environ.get("SCHEDULER_MAX_QUEUE_DEPTH", "50")) # Mentions past this get a "try again" reply
+MAX_CONCURRENT_COMPLETIONS = int(os.environ.get("MAX_CONCURRENT_COMPLETIONS", "4"))
+
+# Drop Slack events redelivered after a slow ack (keyed on event_id / client_msg_id)
+EVENT_DEDUPE_ENABLED = os.environ.get("EVENT_DEDUPE_ENABLED", "true").lower() == "true"
+EVENT_DEDUPE_TTL_SECONDS = int(os.environ.get("EVENT_DEDUPE_TTL_SECONDS", "600"))
+EVENT_DEDUPE_MAX_KEYS = int(os.environ.get("EVENT_DEDUPE_MAX_KEYS", "10000"))
+# Share one completion between identical persona+query requests that are in flight at the same time
+COALESCE_COMPLETIONS = os.environ.get("COALESCE_COMPLETIONS", "false").lower() == "true"
+
+# Answer as every persona mentioned in a message, sharing one retrieval and history fetch
+MULTI_PERSONA_FANOUT = os.environ.get("MULTI_PERSONA_FANOUT", "false").lower() == "true"
+
+# Prompt token budgets, counted with a local tokenizer
+TOKENIZER_PATH = os.environ.get("TOKENIZER_PATH", "./models/gpt-4o-tokenizer.json") # tokenizer.json to load; saved there on the first download
+TOKENIZER_NAME = os.environ.get("TOKENIZER_NAME", "Xenova/gpt-4o") # Hugging Face hub tokenizer matching GPT_MODEL, downloaded if TOKENIZER_PATH is missing
+TOKENIZER_DOWNLOAD_TIMEOUT = float(os.environ.get("TOKENIZER_DOWNLOAD_TIMEOUT", "5")) # One attempt only; HF_HUB_OFFLINE=1 skips it
+PROMPT_HISTORY_TOKENS = int(os.environ.get("PROMPT_HISTORY_TOKENS", "1000"))
+PROMPT_CONTEXT_TOKENS = int(os.environ.get("PROMPT_CONTEXT_TOKENS", "3000"))
+PROMPT_QUERY_TOKENS = int(os.environ.get("PROMPT_QUERY_TOKENS", "500"))
+
+# Logging and tracing
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text") # "text" or "json"
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "none") # Comma-separated: none, console, file, otlp
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+OTEL_SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "c-suite-bot")
+STAGE_SUMMARY_INTERVAL_SECONDS = int(os.environ.get("STAGE_SUMMARY_INTERVAL_SECONDS", "300")) # Log p50/p95/p99 per stage; 0 disables
@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# settings.py reads personas.json at import time
+if not os.path.exists(os.environ.get("PERSONAS_FILE", "personas.json")):
+    os.environ["PERSONAS_FILE"] = os.path.join(ROOT, "personas.example.json")
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+
+import pytest
+
+from lib import dedupe
+from lib.dedupe import AsyncSingleFlight, SingleFlight, TTLKeyStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(dedupe.time, "monotonic", clock)
+    return clock
+
+
+def test_ttl_key_store_remembers_keys_until_they_expire(clock):
+    store = TTLKeyStore(ttl_seconds=10, max_keys=100)
+    assert not store.check_and_add("event-1")
+    assert store.check_and_add("event-1")
+
+    clock.now += 9.9
+    assert store.check_and_add("event-1")
+    clock.now += 0.1
+    assert not store.check_and_add("event-1")
+
+
+def test_ttl_key_store_drops_the_oldest_keys_past_max_keys(clock):
+    store = TTLKeyStore(ttl_seconds=10, max_keys=2)
+    for key in ("a", "b", "c"):
+        assert not store.check_and_add(key)
+    assert store.check_and_add("c")
+    assert not store.check_and_add("a")
+
+
+def test_single_flight_shares_the_leaders_result():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def leader_fn():
+        calls.append("leader")
+        started.set()
+        release.wait()
+        return "answer"
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", leader_fn)))
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=lambda: results.append(flight.do("key", lambda: calls.append("follower"))))
+    follower.start()
+    while flight.shared == 0:
+        pass
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert calls == ["leader"]
+    assert sorted(results) == [("answer", False), ("answer", True)]
+
+
+def test_single_flight_propagates_the_leaders_error_and_forgets_the_key():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def leader_fn():
+        started.set()
+        release.wait()
+        raise ValueError("completion failed")
+
+    def call(fn):
+        try:
+            flight.do("key", fn)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call, args=(leader_fn,))
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=call, args=(lambda: "unused",))
+    follower.start()
+    while flight.shared == 0:
+        pass
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 2 and errors[0] is errors[1]
+    # The failed call isn't cached: the next caller runs its own
+    assert flight.do("key", lambda: "retried") == ("retried", False)
+
+
+def test_async_single_flight_shares_the_leaders_result():
+    async def run():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def fn(name):
+            calls.append(name)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(flight.do("key", fn, "leader"), flight.do("key", fn, "follower"))
+        return calls, results, flight.shared
+
+    calls, results, shared = asyncio.run(run())
+    assert calls == ["leader"]
+    assert results == [("answer", False), ("answer", True)]
+    assert shared == 1
+
+
+def test_async_single_flight_propagates_the_leaders_error():
+    async def run():
+        flight = AsyncSingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("completion failed")
+
+        results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+        return results, flight._calls
+
+    results, calls = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert results[0] is results[1]
+    assert calls == {}
+
+
+def test_async_single_flight_cancelling_the_leader_cancels_its_followers():
+    async def run():
+        flight = AsyncSingleFlight()
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+
+        leader = asyncio.create_task(flight.do("key", slow))
+        await started.wait()
+        follower = asyncio.create_task(flight.do("key", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.gather(leader, follower, return_exceptions=True)
+        return results, flight._calls
+
+    results, calls = asyncio.run(run())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert calls == {}
+
+
+def test_async_single_flight_cancelling_a_follower_leaves_the_leader_running():
+    async def run():
+        flight = AsyncSingleFlight()
+        started = asyncio.Event()
+
+        async def fn():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "answer"
+
+        leader = asyncio.create_task(flight.do("key", fn))
+        await started.wait()
+        follower = asyncio.create_task(flight.do("key", fn))
+        await asyncio.sleep(0)
+        follower.cancel()
+        follower_result = await asyncio.gather(follower, return_exceptions=True)
+        return await leader, follower_result[0]
+
+    leader_result, follower_result = asyncio.run(run())
+    assert leader_result == ("answer", False)
+    assert isinstance(follower_result, asyncio.CancelledError)
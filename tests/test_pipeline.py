@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from lib.pipeline import Pipeline, Stage
+
+
+def run_in_thread(pipeline, items, timeout=5.0):
+    """Runs the pipeline, failing the test if it doesn't return in time. Returns the error it raised, if any."""
+    errors = []
+
+    def target():
+        try:
+            pipeline.run(items)
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "pipeline did not shut down"
+    return errors[0] if errors else None
+
+
+def test_pipeline_runs_every_item_through_every_stage():
+    output, buffered = [], []
+
+    def buffer(item):
+        buffered.append(item)
+        if len(buffered) == 3:
+            full = list(buffered)
+            buffered.clear()
+            return [full]
+
+    def finish():
+        return [list(buffered)] if buffered else []
+
+    double = Stage("double", lambda item: [item * 2], workers=3)
+    pipeline = Pipeline([double, Stage("batch", buffer, finish=finish), Stage("write", output.append)], queue_size=2)
+    assert run_in_thread(pipeline, range(10)) is None
+
+    assert sorted(item for batch in output for item in batch) == [i * 2 for i in range(10)]
+    assert [len(batch) for batch in output] == [3, 3, 3, 1]
+    assert double.items == 10 and double.outputs == 10
+    assert pipeline.source.items == 10
+
+
+def test_pipeline_stops_every_stage_and_reraises_a_stage_error():
+    processed = []
+
+    def fail_on_five(item):
+        if item == 5:
+            raise ValueError("bad item")
+        return [item]
+
+    def slow_write(item):
+        time.sleep(0.01)
+        processed.append(item)
+
+    pipeline = Pipeline([
+        Stage("check", fail_on_five, workers=2),
+        Stage("write", slow_write),
+    ], queue_size=2)
+    error = run_in_thread(pipeline, range(10_000))
+
+    assert isinstance(error, ValueError)
+    # The source stopped feeding soon after the failure instead of draining the input
+    assert pipeline.source.items < 100
+    assert len(processed) < 100
+
+
+def test_pipeline_reraises_an_error_from_the_input():
+    def items():
+        yield 1
+        yield 2
+        raise RuntimeError("source failed")
+
+    pipeline = Pipeline([Stage("noop", lambda item: [item], workers=2), Stage("sink", lambda item: None)], queue_size=1)
+    assert isinstance(run_in_thread(pipeline, items()), RuntimeError)
+
+
+def test_stage_with_finish_needs_one_worker():
+    with pytest.raises(ValueError):
+        Stage("batch", lambda item: None, workers=2, finish=lambda: [])
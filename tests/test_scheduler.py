@@ -0,0 +1,124 @@
+import asyncio
+import threading
+import time
+
+from lib.scheduler import AsyncMentionScheduler, FairQueue, MentionScheduler
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def test_fair_queue_round_robins_channels_then_personas():
+    queue = FairQueue()
+    queue.push(("c1", "p1"), "a1")
+    queue.push(("c1", "p1"), "a2")
+    queue.push(("c1", "p1"), "a3")
+    queue.push(("c2", "p1"), "b1")
+    queue.push(("c1", "p2"), "x1")
+    assert len(queue) == 5
+    assert queue.depth_by_key() == {"c1": 4, "c2": 1}
+
+    assert [queue.pop() for _ in range(5)] == ["a1", "b1", "x1", "a2", "a3"]
+    assert len(queue) == 0
+    assert queue.depth_by_key() == {}
+
+
+def test_fair_queue_is_fifo_within_a_key():
+    queue = FairQueue()
+    for i in range(3):
+        queue.push(("c1",), i)
+    assert [queue.pop() for _ in range(3)] == [0, 1, 2]
+
+
+def test_scheduler_rejects_past_max_queue_depth():
+    release = threading.Event()
+    scheduler = MentionScheduler(workers=1, max_queue_depth=2, max_concurrent_completions=1)
+
+    assert scheduler.submit(("c1",), release.wait)
+    wait_until(lambda: scheduler.stats()["in_flight"] == 1)
+    assert scheduler.submit(("c1",), lambda: None)
+    assert scheduler.submit(("c2",), lambda: None)
+    assert not scheduler.submit(("c3",), lambda: None)
+
+    stats = scheduler.stats()
+    assert stats["queue_depth"] == 2
+    assert stats["rejected"] == 1
+    assert stats["submitted"] == 3
+
+    release.set()
+    wait_until(lambda: scheduler.stats()["completed"] == 3)
+    assert scheduler.stats()["queue_depth"] == 0
+
+
+def test_scheduler_caps_concurrent_completions():
+    scheduler = MentionScheduler(workers=4, max_queue_depth=50, max_concurrent_completions=2)
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def job():
+        with scheduler.completion_slot():
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+
+    for i in range(8):
+        assert scheduler.submit((f"c{i}",), job)
+    wait_until(lambda: scheduler.stats()["completed"] == 8)
+    assert peak[0] == 2
+
+
+def test_scheduler_counts_failed_jobs_and_keeps_working():
+    scheduler = MentionScheduler(workers=1, max_queue_depth=10, max_concurrent_completions=1)
+
+    def fail():
+        raise RuntimeError("boom")
+
+    scheduler.submit(("c1",), fail)
+    scheduler.submit(("c1",), lambda: None)
+    wait_until(lambda: scheduler.stats()["completed"] == 1)
+    stats = scheduler.stats()
+    assert stats["failed"] == 1
+    assert stats["in_flight"] == 0
+
+
+def test_async_scheduler_stats_can_be_read_from_another_thread():
+    """Metric gauges call stats() from the exporter thread while the event loop changes the queue."""
+    errors, stop = [], threading.Event()
+
+    def read_stats(scheduler):
+        while not stop.is_set():
+            try:
+                scheduler.stats()
+            except Exception as e:
+                errors.append(e)
+
+    async def run():
+        scheduler = AsyncMentionScheduler(workers=4, max_queue_depth=10_000, max_concurrent_completions=2)
+
+        async def job():
+            await asyncio.sleep(0)
+
+        reader = threading.Thread(target=read_stats, args=(scheduler,))
+        reader.start()
+        try:
+            for i in range(5000):
+                scheduler.submit((f"c{i % 50}", f"p{i % 3}"), job)
+                if i % 100 == 0:
+                    await asyncio.sleep(0)
+            while scheduler.stats()["completed"] < 5000:
+                await asyncio.sleep(0.001)
+        finally:
+            stop.set()
+            reader.join()
+        return scheduler.stats()
+
+    stats = asyncio.run(run())
+    assert errors == []
+    assert stats["queue_depth"] == 0 and stats["completed"] == 5000
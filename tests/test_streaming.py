@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from lib import streaming
+from lib.streaming import EMPTY_ANSWER_TEXT, AsyncMessageStreamer, MessageStreamer
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(streaming.time, "monotonic", clock)
+    monkeypatch.setattr(streaming.time, "sleep", clock.sleep)
+    return clock
+
+
+class FakeClient:
+    def __init__(self, clock, fail_on=()):
+        self.clock = clock
+        self.fail_on = fail_on
+        self.updates = []
+
+    def chat_update(self, channel, ts, text):
+        if not text:
+            raise RuntimeError("no_text")
+        if len(self.updates) in self.fail_on:
+            self.updates.append(None)
+            raise RuntimeError("ratelimited")
+        self.updates.append((self.clock.now, text))
+
+
+def test_final_edit_respects_the_minimum_interval(clock):
+    client = FakeClient(clock)
+    streamer = MessageStreamer(client, "C1", "1.0", updates_per_second=1)
+    streamer.append("Hello")
+    clock.now += 0.2
+    streamer.append(" world")
+
+    assert streamer.finish() == "Hello world"
+    assert streamer.posted
+    assert [text for _, text in client.updates] == ["Hello", "Hello world"]
+    assert client.updates[1][0] - client.updates[0][0] >= 1.0
+
+
+def test_finish_skips_the_edit_when_the_last_delta_was_already_sent(clock):
+    client = FakeClient(clock)
+    streamer = MessageStreamer(client, "C1", "1.0", updates_per_second=1)
+    streamer.append("Done")
+
+    assert streamer.finish() == "Done"
+    assert streamer.posted
+    assert len(client.updates) == 1
+
+
+def test_empty_completion_replaces_the_placeholder(clock):
+    client = FakeClient(clock)
+    streamer = MessageStreamer(client, "C1", "1.0", updates_per_second=1)
+
+    assert streamer.finish() == EMPTY_ANSWER_TEXT
+    assert streamer.posted
+    assert client.updates == [(clock.now, EMPTY_ANSWER_TEXT)]
+
+
+def test_failed_final_edit_is_reported_not_raised(clock):
+    client = FakeClient(clock, fail_on=(0, 1))
+    streamer = MessageStreamer(client, "C1", "1.0", updates_per_second=1)
+    streamer.append("Partial")
+
+    assert streamer.finish() == "Partial"
+    assert not streamer.posted
+
+
+def test_async_finish_merges_and_falls_back(clock, monkeypatch):
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(streaming.asyncio, "sleep", fake_sleep)
+
+    class AsyncClient(FakeClient):
+        async def chat_update(self, channel, ts, text):
+            FakeClient.chat_update(self, channel, ts, text)
+
+    client = AsyncClient(clock)
+    streamer = AsyncMessageStreamer(client, "C1", "1.0", updates_per_second=1)
+
+    async def run():
+        await streamer.append("Hi")
+        await streamer.append(" there")
+        return await streamer.finish()
+
+    assert asyncio.run(run()) == "Hi there"
+    assert streamer.posted
+    assert slept == [pytest.approx(1.0)]
+    assert [text for _, text in client.updates] == ["Hi", "Hi there"]
@@ -0,0 +1,149 @@
+import hashlib
+
+import pytest
+
+from lib import embeddings, prompt_builder, sync_notion
+from lib.sync_manifest import SyncManifest
+from lib.vector_store import NumpyVectorStore
+
+MAX_TOKENS = 24 # Fits one section of the pages below per chunk, with the approximate tokenizer
+
+
+class FakeNotion:
+    """The parts of NotionFetcher sync_database uses, over pages held in a dict."""
+
+    def __init__(self):
+        self.pages = {} # page ID -> (last_edited_time, [(heading, paragraph), ...])
+        self.requests = 0
+
+    def set_page(self, page_id, edited, sections):
+        self.pages[page_id] = (edited, sections)
+
+    def iter_database(self, database_id):
+        self.requests += 1
+        for page_id, (edited, _) in self.pages.items():
+            yield {
+                "id": page_id,
+                "url": f"https://www.notion.so/{page_id}",
+                "last_edited_time": edited,
+                "properties": {"Name": {"title": [{"text": {"content": f"Page {page_id}"}}]}},
+            }
+
+    def get_blocks(self, page_id):
+        self.requests += 1
+        blocks = []
+        for heading, paragraph in self.pages[page_id][1]:
+            blocks.append({"type": "heading_2", "heading_2": {"rich_text": [{"plain_text": heading}]}})
+            blocks.append({"type": "paragraph", "paragraph": {"rich_text": [{"plain_text": paragraph}]}})
+        return blocks
+
+
+class CountingProvider:
+    name = "test:hash"
+    dimension = 8
+
+    def __init__(self):
+        self.texts = []
+
+    def embed(self, texts):
+        self.texts.extend(texts)
+        return [[float(byte) for byte in hashlib.sha256(text.encode("utf-8")).digest()[:self.dimension]] for text in texts]
+
+
+class RecordingStore(NumpyVectorStore):
+    def __init__(self, path):
+        super().__init__(path, metadata={"embedding_provider": CountingProvider.name, "embedding_dimension": CountingProvider.dimension})
+        self.upserted = []
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.upserted.extend(ids)
+        super().upsert(ids, embeddings, documents, metadatas)
+
+
+def sections(count, prefix="Body"):
+    return [(f"Section {i}", f"{prefix} of section {i}, long enough to fill it.") for i in range(count)]
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    # Chunk sizes below assume ~4 characters per token, whatever tokenizer is installed
+    monkeypatch.setattr(prompt_builder, "_tokenizer", prompt_builder._ApproximateTokenizer())
+    provider = CountingProvider()
+    monkeypatch.setattr(embeddings, "get_embedding_provider", lambda name=None: provider)
+    monkeypatch.setattr(embeddings, "EMBEDDING_STORE_ENABLED", False) # Every changed chunk reaches the provider
+    return provider
+
+
+@pytest.fixture
+def sync(tmp_path, provider):
+    """Runs one sync the way sync_notion.py's __main__ does, with the manifest saved and reloaded in between."""
+    store = RecordingStore(str(tmp_path / "store"))
+    manifest_path = str(tmp_path / "manifest.json")
+
+    def run(notion):
+        store.upserted.clear()
+        provider.texts.clear()
+        manifest = SyncManifest(manifest_path, {"store": "test"})
+        written, deleted = sync_notion.sync_database(notion, store, manifest, "db", full=not manifest.pages, max_tokens=MAX_TOKENS)
+        manifest.save()
+        return written, deleted
+
+    run.store = store
+    run.manifest_path = manifest_path
+    return run
+
+
+def stored_ids(store):
+    return set(store.get(include=[])["ids"])
+
+
+def test_second_sync_of_unchanged_pages_writes_nothing(sync, provider):
+    notion = FakeNotion()
+    notion.set_page("p1", "2024-01-01", sections(3))
+    notion.set_page("p2", "2024-01-01", sections(2))
+
+    written, deleted = sync(notion)
+    assert written == 5 and deleted == 0
+    assert stored_ids(sync.store) == {"p1_0", "p1_1", "p1_2", "p2_0", "p2_1"}
+
+    requests = notion.requests
+    assert sync(notion) == (0, 0)
+    assert sync.store.upserted == [] and provider.texts == []
+    assert notion.requests == requests + 1 # Only the database listing; no page's blocks
+    assert stored_ids(sync.store) == {"p1_0", "p1_1", "p1_2", "p2_0", "p2_1"}
+
+
+def test_edited_page_re_embeds_only_its_changed_chunks(sync, provider):
+    notion = FakeNotion()
+    notion.set_page("p1", "2024-01-01", sections(3))
+    notion.set_page("p2", "2024-01-01", sections(2))
+    sync(notion)
+
+    edited = sections(3)
+    edited[1] = ("Section 1", "Text of section 1, long enough to fill it.") # Same length, so later offsets don't move
+    notion.set_page("p1", "2024-01-02", edited)
+
+    written, deleted = sync(notion)
+    assert (written, deleted) == (1, 0)
+    assert sync.store.upserted == ["p1_1"]
+    assert len(provider.texts) == 1 and "Text of section 1" in provider.texts[0]
+    assert "Text of section 1" in sync.store.get(ids=["p1_1"])["documents"][0]
+
+
+def test_shrunk_and_deleted_pages_lose_their_chunks(sync):
+    notion = FakeNotion()
+    notion.set_page("p1", "2024-01-01", sections(3))
+    notion.set_page("p2", "2024-01-01", sections(2))
+    sync(notion)
+
+    notion.set_page("p1", "2024-01-02", sections(1))
+    del notion.pages["p2"]
+
+    written, deleted = sync(notion)
+    assert written == 0 # p1's first chunk is unchanged
+    assert deleted == 4
+    assert stored_ids(sync.store) == {"p1_0"}
+
+    manifest = SyncManifest(sync.manifest_path, {"store": "test"})
+    assert set(manifest.pages) == {"p1"}
+    assert len(manifest.chunk_hashes("p1")) == 1